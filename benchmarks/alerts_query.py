@@ -0,0 +1,107 @@
+"""Микробенчмарк запроса очереди уведомлений.
+
+Сравнивает прежний ORM-путь (selectinload-цепочки и session.delete по
+одной строке) с одним проекционным запросом claim_changes_query и
+массовым DELETE ... = ANY(...). Нужна база DATABASE_URL с хотя бы одной
+строкой в submitted_tasks. Все изменения откатываются.
+
+    python -m benchmarks.alerts_query --rows 100 --iterations 50
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from sqlalchemy import select, delete, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+
+from database.connect import engine
+from database.models import SubmittedTaskOnChange, SubmittedTask, Task
+from utils.alerts import claim_changes_query, ids_param
+
+
+async def legacy_path(session: AsyncSession, limit: int) -> int:
+    result = await session.execute(
+        select(SubmittedTaskOnChange)
+        .options(
+            selectinload(SubmittedTaskOnChange.submitted_task)
+            .selectinload(SubmittedTask.task)
+            .selectinload(Task.teacher),
+            selectinload(SubmittedTaskOnChange.submitted_task)
+            .selectinload(SubmittedTask.status),
+            selectinload(SubmittedTaskOnChange.submitted_task)
+            .selectinload(SubmittedTask.student),
+        )
+        .order_by(SubmittedTaskOnChange.id)
+        .limit(limit)
+    )
+    changes = result.scalars().all()
+    for change in changes:
+        st = change.submitted_task
+        _ = (st.task.topic, st.grade, st.comment, st.task.teacher.name,
+             st.student.telegram_id)
+        await session.delete(change)
+    await session.flush()
+    return len(changes)
+
+
+async def projection_path(session: AsyncSession, limit: int) -> int:
+    result = await session.execute(claim_changes_query(limit))
+    rows = result.all()
+    await session.execute(
+        delete(SubmittedTaskOnChange)
+        .where(SubmittedTaskOnChange.id == ids_param([r.id for r in rows]))
+    )
+    return len(rows)
+
+
+async def measure(path, rows: int, iterations: int) -> list[float]:
+    timings = []
+    async with engine.connect() as conn:
+        outer = await conn.begin()
+        submitted_task_id = await conn.scalar(
+            select(SubmittedTask.id).limit(1))
+        if submitted_task_id is None:
+            raise SystemExit("В submitted_tasks нет ни одной строки")
+        await conn.execute(
+            insert(SubmittedTaskOnChange),
+            [{"submitted_task_id": submitted_task_id}] * rows,
+        )
+        session = AsyncSession(bind=conn)
+        for _ in range(iterations):
+            savepoint = await conn.begin_nested()
+            started = time.perf_counter()
+            processed = await path(session, rows)
+            timings.append(time.perf_counter() - started)
+            await savepoint.rollback()
+            session.expunge_all()
+            assert processed == rows, processed
+        await outer.rollback()
+    return timings
+
+
+def describe(name: str, timings: list[float]) -> str:
+    ms = sorted(t * 1000 for t in timings)
+    p95 = ms[int(len(ms) * 0.95) - 1] if len(ms) > 1 else ms[0]
+    return (f"{name:<12} median {statistics.median(ms):8.2f} ms   "
+            f"p95 {p95:8.2f} ms   min {ms[0]:8.2f} ms")
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100)
+    parser.add_argument("--iterations", type=int, default=50)
+    args = parser.parse_args()
+
+    legacy = await measure(legacy_path, args.rows, args.iterations)
+    projection = await measure(projection_path, args.rows, args.iterations)
+    print(f"Пачка из {args.rows} строк, {args.iterations} повторов")
+    print(describe("ORM", legacy))
+    print(describe("projection", projection))
+    print(f"ускорение x{statistics.median(legacy) / statistics.median(projection):.1f}")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
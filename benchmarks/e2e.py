@@ -0,0 +1,313 @@
+"""Нагрузочный прогон всего сценария сдачи работы.
+
+N студентов одновременно проходят путь «📝 Темы домашних заданий» →
+курс → тема → «Отправить задание» → PDF → ссылка на код → повторный
+просмотр темы. Обновления подаются прямо в Dispatcher из bot.py, а все
+запросы бота уходят в локальную заглушку Bot API (fake_telegram.py).
+База — DATABASE_URL (лучше отдельная копия со схемой основного
+приложения; миграции из database/migrations применяются перед прогоном,
+как при запуске бота), S3 — ENDPOINT_URL (MinIO) или moto в том же процессе с
+флагом --moto (тогда его работа входит во время шагов и RSS). Тестовые
+курс, студенты и файлы удаляются в конце.
+
+Печатает p50/p95/p99 каждого шага, пропускную способность и пиковый RSS.
+С --save-baseline результат сохраняется в JSON, с --baseline — сравнивается
+с сохранённым, и разница печатается в процентах.
+
+    python -m benchmarks.e2e --students 50 --concurrency 20 --moto
+    python -m benchmarks.e2e --students 50 --baseline bench.json
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import resource
+import statistics
+import time
+from datetime import date, datetime
+
+STEPS = ["menu", "course", "topic", "send", "pdf", "code", "view"]
+CODE_URL = "https://colab.research.google.com/drive/bench"
+# Отрицательные telegram_id не пересекаются с настоящими пользователями
+TELEGRAM_ID_BASE = -1_000_000
+
+
+def start_moto():
+    """Подменяет S3 на moto и направляет на него конфиг бота."""
+    import boto3
+    from moto import mock_aws
+
+    mock = mock_aws()
+    mock.start()
+    os.environ.pop("ENDPOINT_URL", None)
+    os.environ.update(
+        AWS_DEFAULT_REGION="us-east-1",
+        ACCESS_KEY="bench", SECRET_KEY="bench",
+        BUCKET_NAME=os.getenv("BUCKET_NAME") or "bench",
+    )
+    boto3.client("s3").create_bucket(Bucket=os.environ["BUCKET_NAME"])
+    return mock
+
+
+def percentiles(timings: list[float]) -> dict:
+    ms = [t * 1000 for t in timings]
+    if len(ms) < 2:
+        value = ms[0] if ms else 0.0
+        return {"n": len(ms), "p50": value, "p95": value, "p99": value}
+    cuts = statistics.quantiles(ms, n=100, method="inclusive")
+    return {"n": len(ms), "p50": cuts[49], "p95": cuts[94], "p99": cuts[98]}
+
+
+def peak_rss_mib() -> float:
+    # В Linux ru_maxrss в килобайтах
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class Bench:
+    def __init__(self, students: int, concurrency: int, file_size: int):
+        self.students = students
+        self.concurrency = concurrency
+        self.file_size = file_size
+        self.timings: dict[str, list[float]] = {step: [] for step in STEPS}
+        self.failures: dict[str, int] = {}
+        self.update_ids = itertools.count(1)
+        self.course_id: int | None = None
+        self.teacher_id: int | None = None
+        self.course_name = f"Бенчмарк {int(time.time())}"
+        self.topic = "Бенчмарк: задание"
+
+    async def seed(self):
+        from sqlalchemy.dialects.postgresql import insert
+        from database.connect import async_session
+        from database.models import Course, Teacher, Task, Student, Status
+
+        async with async_session() as session:
+            await session.execute(
+                insert(Status).values([
+                    {"id": 0, "name": "На проверке"},
+                    {"id": 1, "name": "Проверено"},
+                ]).on_conflict_do_nothing())
+            course = Course(name=self.course_name, password_hash="",
+                            is_deleted=False)
+            teacher = Teacher(login="bench", name="Бенчмарк",
+                              password_hash="", telegram_nickname="@bench")
+            session.add_all([course, teacher])
+            await session.flush()
+            self.course_id = course.id
+            self.teacher_id = teacher.id
+            session.add(Task(topic=self.topic, task_link="https://example.com",
+                             deadline=date.today(), teacher_id=teacher.id,
+                             type=0, course_id=course.id, need_code=True))
+            session.add_all([
+                Student(group_name="bench", name=f"Студент {i}",
+                        telegram_id=TELEGRAM_ID_BASE - i,
+                        course_id=course.id)
+                for i in range(self.students)
+            ])
+            await session.commit()
+
+    async def cleanup(self):
+        from sqlalchemy import delete
+        from database.connect import async_session
+        from database.models import Course, Teacher
+        from yandexAPI.storage import STORAGE
+
+        if self.course_id is None:
+            return
+        try:
+            keys = [obj["Key"] for obj in
+                    await STORAGE.list_objects(f"{self.course_id}/")]
+            await STORAGE.delete_objects(keys)
+        except Exception as e:
+            print(f"Не удалось удалить файлы бенчмарка: {e}")
+        # Студенты, задания и отправки удаляются каскадом вместе с курсом
+        async with async_session() as session:
+            await session.execute(
+                delete(Course).where(Course.id == self.course_id))
+            await session.execute(
+                delete(Teacher).where(Teacher.id == self.teacher_id))
+            await session.commit()
+
+    def update(self, bot, user_id: int, text: str | None = None,
+               document: dict | None = None):
+        from aiogram.types import Update
+
+        message = {
+            "message_id": next(self.update_ids),
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "bench"},
+        }
+        if text is not None:
+            message["text"] = text
+        if document is not None:
+            message["document"] = document
+        return Update.model_validate(
+            {"update_id": next(self.update_ids), "message": message},
+            context={"bot": bot})
+
+    def scenario(self, bot, user_id: int) -> list[tuple[str, list]]:
+        document = {
+            "file_id": f"pdf{-user_id}",
+            "file_unique_id": f"pdf{-user_id}",
+            "file_name": "work.pdf",
+            "file_size": self.file_size,
+        }
+        texts = {
+            "menu": ["📝 Темы домашних заданий"],
+            "course": [self.course_name],
+            "topic": [self.topic],
+            "send": ["Отправить задание"],
+            "code": [CODE_URL],
+            "view": ["Выбрать другую тему", self.topic],
+        }
+        steps = []
+        for step in STEPS:
+            if step == "pdf":
+                steps.append((step, [self.update(bot, user_id,
+                                                 document=document)]))
+            else:
+                steps.append((step, [self.update(bot, user_id, text=text)
+                                     for text in texts[step]]))
+        return steps
+
+    async def run_student(self, dp, bot, index: int,
+                          semaphore: asyncio.Semaphore) -> bool:
+        user_id = TELEGRAM_ID_BASE - index
+        async with semaphore:
+            for step, updates in self.scenario(bot, user_id):
+                started = time.perf_counter()
+                try:
+                    for update in updates:
+                        await dp.feed_update(bot, update)
+                except Exception as e:
+                    print(f"Студент {index}, шаг {step}: {e}")
+                    self.failures[step] = self.failures.get(step, 0) + 1
+                    return False
+                self.timings[step].append(time.perf_counter() - started)
+        return True
+
+    async def run(self, dp, bot) -> dict:
+        semaphore = asyncio.Semaphore(self.concurrency)
+        started = time.perf_counter()
+        results = await asyncio.gather(*(
+            self.run_student(dp, bot, i, semaphore)
+            for i in range(self.students)))
+        elapsed = time.perf_counter() - started
+        completed = sum(results)
+        return {
+            "params": {"students": self.students,
+                       "concurrency": self.concurrency,
+                       "file_size": self.file_size},
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "steps": {step: percentiles(t) for step, t in self.timings.items()},
+            "failures": self.failures,
+            "completed": completed,
+            "elapsed": elapsed,
+            "flows_per_sec": completed / elapsed,
+            "updates_per_sec": sum(len(t) for t in self.timings.values())
+                               / elapsed,
+            "peak_rss_mib": peak_rss_mib(),
+        }
+
+
+def delta(new: float, old: float) -> str:
+    if not old:
+        return ""
+    return f"{(new - old) / old * 100:+6.1f}%"
+
+
+def report(result: dict, baseline: dict | None):
+    base_steps = baseline["steps"] if baseline else {}
+    print(f"{'шаг':<8}{'n':>6}{'p50, мс':>12}{'p95, мс':>12}{'p99, мс':>12}")
+    for step, stats in result["steps"].items():
+        line = (f"{step:<8}{stats['n']:>6}{stats['p50']:>12.1f}"
+                f"{stats['p95']:>12.1f}{stats['p99']:>12.1f}")
+        old = base_steps.get(step)
+        if old:
+            line += "   " + " ".join(
+                f"{p} {delta(stats[p], old[p])}" for p in ("p50", "p95", "p99"))
+        print(line)
+
+    totals = [
+        ("сценариев/с", "flows_per_sec"),
+        ("обновлений/с", "updates_per_sec"),
+        ("пиковый RSS, МиБ", "peak_rss_mib"),
+    ]
+    print(f"\nЗавершено {result['completed']} из "
+          f"{result['params']['students']} за {result['elapsed']:.1f} с")
+    for title, key in totals:
+        line = f"{title:<18}{result[key]:>10.1f}"
+        if baseline:
+            line += f"   {delta(result[key], baseline[key])}"
+        print(line)
+    if result["failures"]:
+        print(f"Ошибки по шагам: {result['failures']}")
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--students", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--file-size", type=int, default=256 * 1024)
+    parser.add_argument("--moto", action="store_true",
+                        help="moto вместо настоящего S3")
+    parser.add_argument("--baseline", help="JSON прошлого прогона")
+    parser.add_argument("--save-baseline", help="куда сохранить результат")
+    args = parser.parse_args()
+
+    moto = start_moto() if args.moto else None
+    os.environ.setdefault("BOT_TOKEN", "42:bench")
+    os.environ.setdefault("ALERT_TIME", "1")
+
+    # Конфиг бота читается при импорте, поэтому импортируем после настройки
+    # окружения
+    from aiogram import Bot
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+    from benchmarks.fake_telegram import FakeTelegram
+    from bot import create_dispatcher
+    from config import BOT_TOKEN
+    from database.connect import engine
+    from database.migrate import apply_migrations
+    from utils import tracing
+
+    telegram = FakeTelegram(file_size=args.file_size)
+    await telegram.start()
+    bot = Bot(token=BOT_TOKEN, session=AiohttpSession(
+        api=TelegramAPIServer.from_base(telegram.base_url)))
+    dp = create_dispatcher()
+    if tracing.enabled():
+        bot.session.middleware(tracing.TracingRequestMiddleware())
+        tracing.trace_engine(engine, "primary")
+    bench = Bench(args.students, args.concurrency, args.file_size)
+    try:
+        # Как bot.main: без таблиц и индексов из миграций (telegram_files,
+        # fsm_states, уникальный индекс отправок) сценарий падает
+        applied = await apply_migrations()
+        if applied:
+            print(f"Применены миграции: {applied}")
+        await bench.seed()
+        result = await bench.run(dp, bot)
+    finally:
+        await bench.cleanup()
+        await bot.session.close()
+        await telegram.stop()
+        await engine.dispose()
+        if moto is not None:
+            moto.stop()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    report(result, baseline)
+    print(f"Вызовы Bot API: {dict(telegram.calls)}")
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
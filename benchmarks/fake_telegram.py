@@ -0,0 +1,80 @@
+"""Локальная заглушка Bot API для бенчмарков.
+
+Отвечает на методы, которые вызывает бот, правдоподобными объектами и
+отдаёт содержимое «файлов» по file_path. Ничего не хранит, кроме
+счётчиков вызовов.
+"""
+import itertools
+import json
+import time
+from collections import Counter
+
+from aiohttp import web
+
+
+class FakeTelegram:
+    def __init__(self, file_size: int):
+        self.file_size = file_size
+        self.calls: Counter[str] = Counter()
+        self._ids = itertools.count(1)
+        self._runner: web.AppRunner | None = None
+        self.base_url = ""
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0):
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post("/bot{token}/{method}", self.handle_method)
+        app.router.add_get("/file/bot{token}/{path:.+}", self.handle_file)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        host, port = self._runner.addresses[0][:2]
+        self.base_url = f"http://{host}:{port}"
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    def file_content(self, path: str) -> bytes:
+        # Разное содержимое для разных файлов, но без случайности
+        head = f"%PDF-1.4 {path}\n".encode()
+        return head + b"0" * max(self.file_size - len(head), 0)
+
+    def message(self, chat_id: int, **fields) -> dict:
+        return {
+            "message_id": next(self._ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            **fields,
+        }
+
+    async def handle_method(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"].lower()
+        self.calls[method] += 1
+        data = await request.post()
+        chat_id = int(data.get("chat_id", 0))
+
+        if method == "getme":
+            result = {"id": 1, "is_bot": True, "first_name": "bench",
+                      "username": "bench_bot"}
+        elif method == "sendmessage":
+            result = self.message(chat_id, text=data.get("text", ""))
+        elif method == "sendmediagroup":
+            result = [
+                self.message(chat_id, document={
+                    "file_id": f"sent-{next(self._ids)}",
+                    "file_unique_id": f"u-{next(self._ids)}",
+                })
+                for _ in json.loads(data["media"])
+            ]
+        elif method == "getfile":
+            file_id = data["file_id"]
+            result = {"file_id": file_id, "file_unique_id": file_id,
+                      "file_size": self.file_size, "file_path": file_id}
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    async def handle_file(self, request: web.Request) -> web.Response:
+        self.calls["download"] += 1
+        return web.Response(body=self.file_content(request.match_info["path"]))
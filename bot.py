@@ -1,23 +1,78 @@
 import asyncio
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
-from config import BOT_TOKEN, ALERT_TIME
+from config import BOT_TOKEN, ALERT_TIME, FSM_MEMORY_REPORT_INTERVAL, \
+    BOT_MODE, DB_POOL_REPORT_INTERVAL, METRICS_PORT, METRICS_HOST, \
+    METRICS_INTERVAL, DB_MIGRATE
+from database.connect import engine, read_engine, has_replica
+from database.migrate import apply_migrations
+from database.pool import report_pool_stats
 from utils.auth import AuthMiddleware
+from utils.db_session import DbSessionMiddleware
 from handlers import globalСommands, lesson, rolllback, course
 from utils.alerts import alerts
+from utils.memory import report_fsm_memory
+from utils.fsm_storage import create_storage
+from utils.webhook import run_webhook, check_webhook_config
+from utils.metrics import MetricsMiddleware, instrument_engine, \
+    collect_gauges, start_metrics_server
+from utils import tracing
 
-async def main():
-    bot = Bot(token=BOT_TOKEN)
-    dp = Dispatcher(storage=MemoryStorage())
+
+def create_dispatcher() -> Dispatcher:
+    dp = Dispatcher(storage=create_storage())
+    if tracing.enabled():
+        dp.update.outer_middleware(tracing.TracingMiddleware())
+    dp.update.outer_middleware(DbSessionMiddleware())
+    dp.message.middleware(MetricsMiddleware())
+    if tracing.enabled():
+        dp.message.middleware(tracing.HandlerSpanMiddleware())
     dp.message.middleware(AuthMiddleware())
     dp.include_router(globalСommands.router)
     dp.include_router(lesson.router)
     dp.include_router(course.router)
     dp.include_router(rolllback.router)
+    return dp
+
+
+async def main():
+    if BOT_MODE == "webhook":
+        # До миграций и фоновых задач, чтобы не запускаться наполовину
+        check_webhook_config()
+    if DB_MIGRATE:
+        # Без таблиц и индексов из миграций часть запросов падает, поэтому
+        # ошибка здесь останавливает запуск
+        applied = await apply_migrations()
+        if applied:
+            print(f"Применены миграции: {applied}")
+
+    bot = Bot(token=BOT_TOKEN)
+    dp = create_dispatcher()
+
+    engines = {"primary": engine}
+    if has_replica():
+        engines["replica"] = read_engine
 
     asyncio.create_task(alerts(bot, sleep=ALERT_TIME))
+    if FSM_MEMORY_REPORT_INTERVAL:
+        asyncio.create_task(
+            report_fsm_memory(dp.storage, FSM_MEMORY_REPORT_INTERVAL))
+    if DB_POOL_REPORT_INTERVAL:
+        asyncio.create_task(
+            report_pool_stats(engines, DB_POOL_REPORT_INTERVAL))
+    if tracing.enabled():
+        bot.session.middleware(tracing.TracingRequestMiddleware())
+        for name, db_engine in engines.items():
+            tracing.trace_engine(db_engine, name)
+    if METRICS_PORT:
+        for name, db_engine in engines.items():
+            instrument_engine(db_engine, name)
+        start_metrics_server(METRICS_HOST, METRICS_PORT)
+        asyncio.create_task(collect_gauges(engines, METRICS_INTERVAL))
 
-    await dp.start_polling(bot)
+    if BOT_MODE == "webhook":
+        await run_webhook(dp, bot)
+    else:
+        await dp.start_polling(bot)
 
 
 if __name__ == "__main__":
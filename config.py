@@ -6,4 +6,97 @@ SECRET_KEY = os.getenv("SECRET_KEY")
 ENDPOINT_URL = os.getenv("ENDPOINT_URL")
 BUCKET_NAME = os.getenv("BUCKET_NAME")
 DATABASE_URL = os.getenv("DATABASE_URL")
-ALERT_TIME = int(os.getenv("ALERT_TIME"))
\ No newline at end of file
+ALERT_TIME = int(os.getenv("ALERT_TIME"))
+
+# Применять SQL-миграции из database/migrations при старте бота
+DB_MIGRATE = os.getenv("DB_MIGRATE", "1") == "1"
+# Необязательная реплика только для чтения. Пустая — всё читаем с primary
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL") or None
+# Сколько секунд после отправки работы читаем данные студента с primary,
+# пока реплика не догонит
+READ_YOUR_WRITES_WINDOW = float(os.getenv("READ_YOUR_WRITES_WINDOW", "5"))
+# Пул соединений с базой (на каждый engine)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") == "1"
+# Кэш подготовленных выражений asyncpg на соединение и кэш компиляции
+# SQLAlchemy на engine
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "500"))
+DB_QUERY_CACHE_SIZE = int(os.getenv("DB_QUERY_CACHE_SIZE", "1000"))
+# База за PgBouncer в режиме transaction: без своего пула и кэша выражений
+DB_PGBOUNCER = os.getenv("DB_PGBOUNCER", "0") == "1"
+# Раз в сколько секунд печатать состояние пулов соединений (0 — никогда)
+DB_POOL_REPORT_INTERVAL = int(os.getenv("DB_POOL_REPORT_INTERVAL", "0"))
+# Метрики Prometheus на http://METRICS_HOST:METRICS_PORT/metrics (0 — выкл.)
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+# Как часто обновлять опрашиваемые метрики (очередь уведомлений, пулы)
+METRICS_INTERVAL = int(os.getenv("METRICS_INTERVAL", "15"))
+# Альбомы: сколько секунд ждать следующую часть, максимум файлов в одной
+# отправке (альбом больше него отклоняется целиком), через сколько секунд
+# брошенный альбом выбрасывается и сколько альбомов можно собирать
+# одновременно
+ALBUM_DEBOUNCE = float(os.getenv("ALBUM_DEBOUNCE", "1"))
+ALBUM_MAX_FILES = int(os.getenv("ALBUM_MAX_FILES", "10"))
+ALBUM_MAX_AGE = float(os.getenv("ALBUM_MAX_AGE", "60"))
+ALBUM_MAX_GROUPS = int(os.getenv("ALBUM_MAX_GROUPS", "1000"))
+# Трассировка обновлений: доля трасс, которые пишутся в TRACE_FILE, и
+# порог в секундах, после которого дерево участков печатается в лог и
+# пишется в файл всегда. Оба 0 — трассировка выключена
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0"))
+TRACE_SLOW_SECONDS = float(os.getenv("TRACE_SLOW_SECONDS", "0"))
+TRACE_FILE = os.getenv("TRACE_FILE", "traces.jsonl")
+
+# S3: размер пула HTTP-соединений и лимит одновременных запросов
+S3_MAX_CONNECTIONS = int(os.getenv("S3_MAX_CONNECTIONS", "20"))
+S3_MAX_IN_FLIGHT = int(os.getenv("S3_MAX_IN_FLIGHT", "16"))
+# Размер части multipart-загрузки (минимум 5 МБ)
+S3_PART_SIZE = int(os.getenv("S3_PART_SIZE", str(5 * 1024 * 1024)))
+# Сколько файлов одной отправки качаем/загружаем одновременно
+S3_FANOUT = int(os.getenv("S3_FANOUT", "4"))
+# Бюджет памяти LRU-кэша содержимого объектов S3 (0 — кэш выключен)
+OBJECT_CACHE_BYTES = int(os.getenv("OBJECT_CACHE_BYTES",
+                                   str(64 * 1024 * 1024)))
+# Сколько секунд держим в памяти данные студента (и отказ в доступе)
+IDENTITY_TTL = int(os.getenv("IDENTITY_TTL", "300"))
+IDENTITY_NEGATIVE_TTL = int(os.getenv("IDENTITY_NEGATIVE_TTL", "10"))
+# Сколько пользователей держим в этом кэше
+IDENTITY_CACHE_SIZE = int(os.getenv("IDENTITY_CACHE_SIZE", "10000"))
+# Справочник курсов и тем: как часто сверять версию и перечитывать целиком
+CATALOG_CHECK_INTERVAL = int(os.getenv("CATALOG_CHECK_INTERVAL", "30"))
+CATALOG_FULL_REFRESH = int(os.getenv("CATALOG_FULL_REFRESH", "600"))
+# Раз в сколько секунд печатать расход памяти на FSM-состояния (0 — никогда)
+FSM_MEMORY_REPORT_INTERVAL = int(os.getenv("FSM_MEMORY_REPORT_INTERVAL", "0"))
+# Хранилище FSM: memory, redis или postgres
+FSM_STORAGE = os.getenv("FSM_STORAGE", "memory")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+# Через сколько секунд без изменений состояние пользователя забывается
+FSM_STATE_TTL = int(os.getenv("FSM_STATE_TTL", str(30 * 24 * 3600)))
+# Получение обновлений: polling или webhook
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", "1000"))
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "16"))
+# Алерты об оценках: poll — опрос раз в ALERT_TIME секунд, notify — по
+# LISTEN/NOTIFY, а опрос с нарастающей до ALERT_MAX_SLEEP паузой — подстраховка
+ALERT_MODE = os.getenv("ALERT_MODE", "poll")
+ALERT_MAX_SLEEP = int(os.getenv("ALERT_MAX_SLEEP", "60"))
+# Рассылка уведомлений: сообщений в секунду всего и пауза между
+# сообщениями в один чат; сколько раз повторять недоставленное
+ALERT_RATE = float(os.getenv("ALERT_RATE", "30"))
+# Сколько процессов бота рассылают уведомления: лимит ALERT_RATE общий на
+# бота, поэтому каждый берёт себе ALERT_RATE / ALERT_WORKERS
+ALERT_WORKERS = int(os.getenv("ALERT_WORKERS", "1"))
+ALERT_CHAT_INTERVAL = float(os.getenv("ALERT_CHAT_INTERVAL", "1"))
+ALERT_MAX_ATTEMPTS = int(os.getenv("ALERT_MAX_ATTEMPTS", "5"))
+ALERT_BATCH_SIZE = int(os.getenv("ALERT_BATCH_SIZE", "100"))
+# На сколько секунд воркер рассылки арендует взятые строки очереди
+ALERT_CLAIM_TIMEOUT = int(os.getenv("ALERT_CLAIM_TIMEOUT", "300"))
+# Объединять все проверенные работы студента в одно сообщение
+ALERT_DIGEST = os.getenv("ALERT_DIGEST", "0") == "1"
@@ -1,7 +1,105 @@
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator
+
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
-from config import DATABASE_URL
+from config import DATABASE_URL, DATABASE_READ_URL, READ_YOUR_WRITES_WINDOW
+from database.pool import engine_options
 
-engine = create_async_engine(DATABASE_URL, echo=False)
+engine = create_async_engine(DATABASE_URL, **engine_options(DATABASE_URL))
 async_session = sessionmaker(
-    engine, class_=AsyncSession, expire_on_commit=True)
\ No newline at end of file
+    engine, class_=AsyncSession, expire_on_commit=True)
+
+# Реплика для чтения. Если она не настроена, это тот же engine
+read_engine = (create_async_engine(DATABASE_READ_URL,
+                                   **engine_options(DATABASE_READ_URL))
+               if DATABASE_READ_URL else engine)
+read_session = sessionmaker(
+    read_engine, class_=AsyncSession, expire_on_commit=True)
+
+# Сессии на время обработки одного обновления (DbSessionMiddleware).
+# Объекты не протухают после commit: иначе каждый коммит в середине
+# хендлера заставлял бы перечитывать их из базы
+update_session_factory = sessionmaker(
+    engine, class_=AsyncSession, expire_on_commit=False)
+update_read_session_factory = sessionmaker(
+    read_engine, class_=AsyncSession, expire_on_commit=False)
+current_session: ContextVar[AsyncSession | None] = ContextVar(
+    "current_session", default=None)
+current_read_session: ContextVar[AsyncSession | None] = ContextVar(
+    "current_read_session", default=None)
+
+# student_id -> до какого момента (time.monotonic) читать его с primary
+_pinned: dict[int, float] = {}
+
+
+def has_replica() -> bool:
+    return read_engine is not engine
+
+
+def pin_to_primary(student_id: int):
+    """После записи данные студента какое-то время читаются с primary,
+    чтобы он сразу увидел свою отправку, даже если реплика отстаёт."""
+    now = time.monotonic()
+    for key in [k for k, until in _pinned.items() if until <= now]:
+        del _pinned[key]
+    _pinned[student_id] = now + READ_YOUR_WRITES_WINDOW
+
+
+def is_pinned(student_id: int) -> bool:
+    until = _pinned.get(student_id)
+    return until is not None and until > time.monotonic()
+
+
+@asynccontextmanager
+async def _shared(session: AsyncSession) -> AsyncIterator[AsyncSession]:
+    """Общая сессия обновления на время одного запроса.
+
+    Сессия не закрывается (её закроет middleware), но транзакция
+    завершается сразу: иначе соединение оставалось бы «idle in
+    transaction» до конца обработки обновления, в том числе пока хендлер
+    ходит в Telegram и S3.
+    """
+    try:
+        yield session
+    except BaseException:
+        await session.rollback()
+        raise
+    if session.in_transaction():
+        await session.commit()
+
+
+@asynccontextmanager
+async def get_session() -> AsyncIterator[AsyncSession]:
+    """Сессия текущего обновления, а вне обновления — новая сессия."""
+    session = current_session.get()
+    if session is not None:
+        async with _shared(session):
+            yield session
+        return
+    async with async_session() as session:
+        yield session
+
+
+@asynccontextmanager
+async def get_read_session(
+        student_id: int | None = None) -> AsyncIterator[AsyncSession]:
+    """Сессия для чтения: реплика, если она есть.
+
+    Данные студента, который недавно что-то записал, читаются с primary
+    (см. pin_to_primary). Без реплики это просто get_session().
+    """
+    if not has_replica() or (student_id is not None
+                             and is_pinned(student_id)):
+        async with get_session() as session:
+            yield session
+        return
+    session = current_read_session.get()
+    if session is not None:
+        async with _shared(session):
+            yield session
+        return
+    async with read_session() as session:
+        yield session
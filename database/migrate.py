@@ -0,0 +1,62 @@
+"""Применяет SQL-миграции из database/migrations к DATABASE_URL.
+
+Файлы применяются по порядку имён, каждый в своей транзакции, и
+запоминаются в таблице schema_migrations. Бот вызывает apply_migrations()
+при старте (если DB_MIGRATE=1), а вручную их можно применить так:
+
+    python -m database.migrate
+"""
+import asyncio
+from pathlib import Path
+
+import asyncpg
+
+from config import DATABASE_URL
+from database.notify import asyncpg_dsn
+
+MIGRATIONS_DIR = Path(__file__).parent / "migrations"
+# Ключ advisory-блокировки: миграции применяет только один процесс бота,
+# остальные ждут и видят их уже применёнными
+MIGRATIONS_LOCK = 0x7467626F74
+
+CREATE_MIGRATIONS_TABLE = """
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    name varchar(256) PRIMARY KEY,
+    applied_at timestamptz NOT NULL DEFAULT now()
+)
+"""
+
+
+async def apply_migrations(dsn: str = DATABASE_URL) -> list[str]:
+    """Применяет ещё не применённые миграции и возвращает их имена."""
+    # Отдельное соединение asyncpg: файл миграции — несколько команд, а
+    # их можно выполнить только простым протоколом, без подготовки
+    conn = await asyncpg.connect(asyncpg_dsn(dsn), statement_cache_size=0)
+    applied = []
+    try:
+        async with conn.transaction():
+            await conn.execute("SELECT pg_advisory_xact_lock($1)",
+                               MIGRATIONS_LOCK)
+            await conn.execute(CREATE_MIGRATIONS_TABLE)
+        for path in sorted(MIGRATIONS_DIR.glob("*.sql")):
+            async with conn.transaction():
+                await conn.execute("SELECT pg_advisory_xact_lock($1)",
+                                   MIGRATIONS_LOCK)
+                done = await conn.fetchval(
+                    "SELECT 1 FROM schema_migrations WHERE name = $1",
+                    path.name)
+                if done:
+                    continue
+                await conn.execute(path.read_text(encoding="utf-8"))
+                await conn.execute(
+                    "INSERT INTO schema_migrations (name) VALUES ($1)",
+                    path.name)
+                applied.append(path.name)
+    finally:
+        await conn.close()
+    return applied
+
+
+if __name__ == "__main__":
+    names = asyncio.run(apply_migrations())
+    print(f"Применены миграции: {names}" if names else "Новых миграций нет")
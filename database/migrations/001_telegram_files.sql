@@ -0,0 +1,6 @@
+-- file_id уже отправленных в Telegram объектов S3 (database.models.TelegramFile)
+CREATE TABLE IF NOT EXISTS telegram_files (
+    s3_key varchar(512) PRIMARY KEY,
+    etag varchar(256) NOT NULL,
+    file_id varchar(256) NOT NULL
+);
@@ -0,0 +1,3 @@
+-- Студент ищется по telegram_id на каждом сообщении (utils.identity)
+CREATE INDEX IF NOT EXISTS "IX_students_telegram_id"
+    ON students (telegram_id);
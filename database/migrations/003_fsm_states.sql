@@ -0,0 +1,10 @@
+-- FSM-состояния пользователей для FSM_STORAGE=postgres (utils.fsm_storage)
+CREATE TABLE IF NOT EXISTS fsm_states (
+    key varchar(256) PRIMARY KEY,
+    state varchar(256) NULL,
+    data text NULL,
+    updated_at timestamptz NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS "IX_fsm_states_updated_at"
+    ON fsm_states (updated_at);
@@ -0,0 +1,3 @@
+-- Аренда строк очереди уведомлений воркером рассылки (utils.alerts)
+ALTER TABLE submitted_tasks_on_change
+    ADD COLUMN IF NOT EXISTS claimed_until timestamptz NULL;
@@ -0,0 +1,41 @@
+-- Одна отправка на (student_id, task_id): на этом индексе держится
+-- INSERT ... ON CONFLICT в save_submission_to_db. Старый код при
+-- одновременных отправках мог вставить дубли, поэтому сначала их сливаем:
+-- остаётся последняя изменённая строка, очередь уведомлений переводится на
+-- неё, остальные удаляются
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_indexes
+               WHERE tablename = 'submitted_tasks'
+                 AND indexname = 'UX_submitted_tasks_student_id_task_id') THEN
+        RETURN;
+    END IF;
+
+    -- Пока идёт слияние, бот старой версии не должен вставить новые дубли
+    LOCK TABLE submitted_tasks IN SHARE ROW EXCLUSIVE MODE;
+
+    CREATE TEMP TABLE submitted_tasks_duplicates ON COMMIT DROP AS
+    SELECT id, keep_id
+    FROM (
+        SELECT id,
+               first_value(id) OVER (
+                   PARTITION BY student_id, task_id
+                   ORDER BY last_modified_date DESC, id DESC
+               ) AS keep_id
+        FROM submitted_tasks
+    ) ranked
+    WHERE id <> keep_id;
+
+    UPDATE submitted_tasks_on_change c
+    SET submitted_task_id = d.keep_id
+    FROM submitted_tasks_duplicates d
+    WHERE c.submitted_task_id = d.id;
+
+    DELETE FROM submitted_tasks s
+    USING submitted_tasks_duplicates d
+    WHERE s.id = d.id;
+
+    CREATE UNIQUE INDEX "UX_submitted_tasks_student_id_task_id"
+        ON submitted_tasks (student_id, task_id);
+END
+$$;
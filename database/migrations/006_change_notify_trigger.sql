@@ -0,0 +1,17 @@
+-- Один NOTIFY на вставку в очередь изменений: слушателю (utils.alerts)
+-- важен сам факт новых строк, а не их содержимое. Имя канала совпадает с
+-- database.notify.CHANGES_CHANNEL
+CREATE OR REPLACE FUNCTION notify_submitted_tasks_on_change()
+RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('submitted_tasks_on_change', '');
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS submitted_tasks_on_change_notify
+    ON submitted_tasks_on_change;
+
+CREATE TRIGGER submitted_tasks_on_change_notify
+    AFTER INSERT ON submitted_tasks_on_change
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_submitted_tasks_on_change();
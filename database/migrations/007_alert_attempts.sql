@@ -0,0 +1,4 @@
+-- Счётчик неудачных попыток доставки уведомления (utils.alerts): хранится
+-- в строке очереди, чтобы его видели все воркеры и он переживал перезапуск
+ALTER TABLE submitted_tasks_on_change
+    ADD COLUMN IF NOT EXISTS attempts integer NOT NULL DEFAULT 0;
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Index, Date, Boolean
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Index, Date, Boolean, Text, func
 from sqlalchemy.orm import declarative_base, relationship
 
 Base = declarative_base()
@@ -34,6 +34,7 @@ class Student(Base):
 
     __table_args__ = (
         Index("IX_students_course_id", "course_id"),
+        Index("IX_students_telegram_id", "telegram_id"),
     )
 
 
@@ -80,9 +81,23 @@ class SubmittedTask(Base):
         Index("IX_submitted_tasks_status_id", "status_id"),
         Index("IX_submitted_tasks_student_id", "student_id"),
         Index("IX_submitted_tasks_task_id", "task_id"),
+        Index("UX_submitted_tasks_student_id_task_id", "student_id",
+              "task_id", unique=True),
     )
 
 
+class TelegramFile(Base):
+    """Telegram file_id уже отправленного объекта из S3.
+
+    Пока ETag объекта не изменился, файл можно переслать по file_id,
+    не скачивая его из хранилища.
+    """
+    __tablename__ = "telegram_files"
+
+    s3_key = Column(String(512), primary_key=True)
+    etag = Column(String(256), nullable=False)
+    file_id = Column(String(256), nullable=False)
+
 
 class Task(Base):
     __tablename__ = "tasks"
@@ -141,6 +156,12 @@ class SubmittedTaskOnChange(Base):
         nullable=False,
     )
 
+    # Аренда строки воркером рассылки: пока срок не истёк, строку не берут
+    # другие воркеры. Если воркер упал, строка вернётся в очередь сама
+    claimed_until = Column(DateTime(timezone=True), nullable=True)
+    # Сколько раз уведомление не удалось доставить из-за временных ошибок
+    attempts = Column(Integer, nullable=False, server_default="0")
+
     submitted_task = relationship("SubmittedTask")
 
     __table_args__ = (
@@ -148,4 +169,19 @@ class SubmittedTaskOnChange(Base):
             "IX_SubmittedTaskOnChange_SubmittedTaskId",
             submitted_task_id,
         ),
-    )
\ No newline at end of file
+    )
+
+
+class FsmRecord(Base):
+    """Состояние и данные FSM одного пользователя (utils.fsm_storage)."""
+    __tablename__ = "fsm_states"
+
+    key = Column(String(256), primary_key=True)
+    state = Column(String(256), nullable=True)
+    data = Column(Text, nullable=True)
+    updated_at = Column(DateTime(timezone=True), nullable=False,
+                        server_default=func.now())
+
+    __table_args__ = (
+        Index("IX_fsm_states_updated_at", "updated_at"),
+    )
@@ -0,0 +1,41 @@
+import asyncio
+from typing import Callable
+
+import asyncpg
+from sqlalchemy.engine import make_url
+
+from config import DATABASE_URL
+
+# Канал, в который триггер из миграции 006_change_notify_trigger.sql
+# шлёт NOTIFY на каждую вставку в очередь изменений
+CHANGES_CHANNEL = "submitted_tasks_on_change"
+
+
+def asyncpg_dsn(url: str) -> str:
+    """DSN для asyncpg из URL SQLAlchemy (postgresql+asyncpg://...)."""
+    return make_url(url).set(drivername="postgresql") \
+        .render_as_string(hide_password=False)
+
+
+async def listen(channel: str, callback: Callable[[], None],
+                 ping_interval: int = 30):
+    """Держит отдельное соединение с LISTEN channel и вызывает callback на
+    каждое уведомление. Оборванное соединение переоткрывается, а после
+    переподключения callback вызывается сразу: пока мы не слушали,
+    уведомления могли потеряться."""
+    while True:
+        try:
+            conn = await asyncpg.connect(asyncpg_dsn(DATABASE_URL))
+            try:
+                await conn.add_listener(channel, lambda *args: callback())
+                callback()
+                while True:
+                    await asyncio.sleep(ping_interval)
+                    await conn.execute("SELECT 1")
+            finally:
+                await conn.close()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"LISTEN {channel} прерван: {e}")
+        await asyncio.sleep(5)
@@ -0,0 +1,124 @@
+import asyncio
+import time
+from uuid import uuid4
+
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool
+
+from config import DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, \
+    DB_POOL_RECYCLE, DB_POOL_PRE_PING, DB_STATEMENT_CACHE_SIZE, \
+    DB_QUERY_CACHE_SIZE, DB_PGBOUNCER
+
+# Ожидание соединения дольше этого считаем ожиданием, а не мгновенной выдачей
+WAIT_THRESHOLD = 0.001
+
+
+class PoolStats:
+    """Счётчики выдачи соединений из пула."""
+
+    def __init__(self):
+        self.checkouts = 0
+        self.waits = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def record(self, elapsed: float):
+        self.checkouts += 1
+        if elapsed >= WAIT_THRESHOLD:
+            self.waits += 1
+            self.wait_total += elapsed
+            self.wait_max = max(self.wait_max, elapsed)
+
+    def as_dict(self) -> dict:
+        return {
+            "checkouts": self.checkouts,
+            "waits": self.waits,
+            "timeouts": self.timeouts,
+            "wait_total": round(self.wait_total, 3),
+            "wait_max": round(self.wait_max, 3),
+        }
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """Пул, который замеряет, сколько ждали свободного соединения.
+
+    _do_get — внутренний метод QueuePool, который и блокируется, пока в
+    пуле нет свободного соединения (или до pool_timeout).
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            entry = super()._do_get()
+        except Exception:
+            self.stats.timeouts += 1
+            raise
+        self.stats.record(time.perf_counter() - started)
+        return entry
+
+    def recreate(self):
+        # Пул пересоздаётся после разрыва соединений — счётчики сохраняем
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+
+def engine_options(url: str) -> dict:
+    """Параметры create_async_engine из конфига.
+
+    За PgBouncer в режиме transaction пулом занимается он сам: берём
+    NullPool и отключаем кэш подготовленных выражений asyncpg, а имена
+    выражений делаем уникальными, чтобы они не конфликтовали на чужих
+    серверных соединениях.
+    """
+    options = {"echo": False, "query_cache_size": DB_QUERY_CACHE_SIZE}
+    is_asyncpg = make_url(url).get_driver_name() == "asyncpg"
+
+    if DB_PGBOUNCER:
+        options["poolclass"] = NullPool
+        if is_asyncpg:
+            options["connect_args"] = {
+                "statement_cache_size": 0,
+                "prepared_statement_cache_size": 0,
+                "prepared_statement_name_func":
+                    lambda: f"__asyncpg_{uuid4()}__",
+            }
+        return options
+
+    options.update(
+        poolclass=TimedQueuePool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+    )
+    if is_asyncpg:
+        options["connect_args"] = {
+            "prepared_statement_cache_size": DB_STATEMENT_CACHE_SIZE,
+        }
+    return options
+
+
+def pool_stats(engine) -> dict:
+    """Состояние пула: занятые/свободные соединения и счётчики ожидания."""
+    pool = engine.sync_engine.pool
+    result = {"status": pool.status()}
+    if isinstance(pool, TimedQueuePool):
+        result.update(pool.stats.as_dict())
+        result.update(checked_out=pool.checkedout(), size=pool.size(),
+                      overflow=pool.overflow())
+    return result
+
+
+async def report_pool_stats(engines: dict, interval: int):
+    """Периодически печатает состояние пулов соединений."""
+    while True:
+        await asyncio.sleep(interval)
+        for name, engine in engines.items():
+            print(f"DB pool {name}: {pool_stats(engine)}")
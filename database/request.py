@@ -1,131 +1,128 @@
-from datetime import datetime
+from dataclasses import dataclass
+from datetime import datetime, date
 from zoneinfo import ZoneInfo
-from sqlalchemy import select, desc
+from sqlalchemy import select, desc, func, and_, lambda_stmt
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm import selectinload
-from database.connect import async_session
-from database.models import Student, Course, Task, SubmittedTask
-
-
-async def get_student_by_telegram_id(telegram_id: int) -> Student | None:
-    async with async_session() as session:
-        result = await session.execute(
-            select(Student).where(Student.telegram_id == telegram_id)
-        )
-        return result.scalars().first()
-
-
-async def get_available_courses_for_student(tg_id: int) -> list[Course]:
-    async with async_session() as session:
-        result = await session.execute(
-            select(Student).where(Student.telegram_id == tg_id)
-        )
-        students = result.scalars().all()
-
-        course_ids = {student.course_id for student in students if
-                      student.course_id is not None}
-
-        if not course_ids:
-            return []
-
-        result = await session.execute(
-            select(Course).where(Course.id.in_(course_ids)).where(Course.is_deleted == False)
-        )
-        return result.scalars().all()
-
-
-async def get_topics_by_course_id(course_id: int) -> list[Task]:
-    async with async_session() as session:
-        result = await session.execute(
-            select(Task).where(Task.course_id == course_id)
-        )
-        return result.scalars().all()
-
-
-async def has_student_submitted(student_id: int,
-                                task_id: int) -> SubmittedTask | None:
-    async with async_session() as session:
-        result = await session.execute(
-            select(SubmittedTask)
-            .where(SubmittedTask.student_id == student_id)
-            .where(SubmittedTask.task_id == task_id)
-            .limit(1)
-        )
-        return result.scalars().first()
-
-
-async def get_task_by_id(task_id: int) -> Task | None:
-    async with async_session() as session:
-        result = await session.execute(
-            select(Task)
-            .options(selectinload(Task.teacher))
-            .where(Task.id == task_id)
-        )
-        return result.scalar_one_or_none()
-
-
-
-async def get_student_id_by_telegram_id(tg_id: int) -> int | None:
-    async with async_session() as session:
-        result = await session.execute(
-            select(Student.id).where(Student.telegram_id == tg_id)
-        )
-        student_id = result.scalar()
-        return student_id
-
-
-async def save_submission_to_db(student_id: int, task_id: int, prefix: str | None, code_url: str | None):
-    async with async_session() as session:
-        result = await session.execute(
-            select(SubmittedTask).where(
-                SubmittedTask.student_id == student_id,
-                SubmittedTask.task_id == task_id
-            )
-        )
-        existing: SubmittedTask = result.scalar_one_or_none()
-        now = datetime.now(ZoneInfo("Asia/Yekaterinburg"))
-        if existing:
-            # Обновляем дату и путь
-            existing.last_modified_date = now
-            existing.status_id = 0
-
-            existing.homework_prefix = prefix
-            existing.code_url = code_url
-        else:
-            submission = SubmittedTask(
-                student_id=student_id,
-                task_id=task_id,
-                status_id=0, # 0 значит на проверке, 1 Проверено
-                homework_prefix=prefix,
-                submitted_date=now,
-                last_modified_date=now,
-                comment="",
-                code_url=code_url,
-            )
-            session.add(submission)
+from database.connect import get_session, get_read_session, pin_to_primary
+from database.models import Student, Course, Task, SubmittedTask, \
+    TelegramFile, Teacher, Status, SubmittedTaskOnChange
+
+
+async def get_student_rows_by_telegram_id(
+        tg_id: int) -> list[tuple[int, str, int]]:
+    """(id, name, course_id) всех записей студента — по одной на курс."""
+    async with get_read_session() as session:
+        result = await session.execute(lambda_stmt(
+            lambda: select(Student.id, Student.name, Student.course_id)
+            .where(Student.telegram_id == tg_id)
+            .order_by(Student.id)
+        ))
+        return [tuple(row) for row in result.all()]
+
+
+async def save_submission_to_db(student_id: int, task_id: int, prefix: str | None, code_url: str | None) -> int:
+    # Один INSERT ... ON CONFLICT по уникальному (student_id, task_id):
+    # без отдельного SELECT и без дублей при одновременных отправках
+    now = datetime.now(ZoneInfo("Asia/Yekaterinburg"))
+    stmt = insert(SubmittedTask).values(
+        student_id=student_id,
+        task_id=task_id,
+        status_id=0, # 0 значит на проверке, 1 Проверено
+        homework_prefix=prefix,
+        submitted_date=now,
+        last_modified_date=now,
+        comment="",
+        code_url=code_url,
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[SubmittedTask.student_id, SubmittedTask.task_id],
+        # Обновляем дату и путь
+        set_={
+            "last_modified_date": now,
+            "status_id": 0,
+            "homework_prefix": prefix,
+            "code_url": code_url,
+        },
+    ).returning(SubmittedTask.id)
+    async with get_session() as session:
+        result = await session.execute(stmt)
+        submission_id = result.scalar_one()
         await session.commit()
-
-
-async def get_last_work(student_id: int,
-                        task_id: int) -> SubmittedTask | None:
-    async with async_session() as session:
-        result = await session.execute(
-            select(SubmittedTask)
-            .options(
-                selectinload(SubmittedTask.task)
-                .selectinload(Task.teacher),
-                selectinload(SubmittedTask.status),
-            )
-            .where(SubmittedTask.student_id == student_id,
-                   SubmittedTask.task_id == task_id)
+    pin_to_primary(student_id)
+    return submission_id
+
+
+@dataclass(frozen=True, slots=True)
+class TaskView:
+    """Всё, что нужно для экрана задания: само задание, преподаватель и
+    последняя отправка студента со статусом (если она есть)."""
+    task_id: int
+    topic: str
+    task_link: str
+    deadline: date
+    need_code: bool
+    teacher_name: str
+    teacher_nickname: str
+    submission_id: int | None
+    status_id: int | None
+    status_name: str | None
+    grade: int | None
+    comment: str | None
+    submitted_date: datetime | None
+    last_modified_date: datetime | None
+    homework_prefix: str | None
+    code_url: str | None
+
+    @property
+    def submitted(self) -> bool:
+        return self.submission_id is not None
+
+
+TASK_VIEW_COLUMNS = (
+    Task.id.label("task_id"),
+    Task.topic,
+    Task.task_link,
+    Task.deadline,
+    Task.need_code,
+    Teacher.name.label("teacher_name"),
+    Teacher.telegram_nickname.label("teacher_nickname"),
+    SubmittedTask.id.label("submission_id"),
+    SubmittedTask.status_id,
+    Status.name.label("status_name"),
+    SubmittedTask.grade,
+    SubmittedTask.comment,
+    SubmittedTask.submitted_date,
+    SubmittedTask.last_modified_date,
+    SubmittedTask.homework_prefix,
+    SubmittedTask.code_url,
+)
+
+
+async def get_task_view(student_id: int, task_id: int) -> TaskView | None:
+    # Задание, преподаватель и последняя отправка одним запросом.
+    # lambda_stmt кэширует построенный запрос целиком: на каждом вызове
+    # подставляются только параметры
+    async with get_read_session(student_id) as session:
+        result = await session.execute(lambda_stmt(
+            lambda: select(*TASK_VIEW_COLUMNS)
+            .join(Teacher, Teacher.id == Task.teacher_id)
+            .outerjoin(SubmittedTask,
+                       and_(SubmittedTask.task_id == Task.id,
+                            SubmittedTask.student_id == student_id))
+            .outerjoin(Status, Status.id == SubmittedTask.status_id)
+            .where(Task.id == task_id)
             .order_by(desc(SubmittedTask.submitted_date))
             .limit(1)
-        )
-        return result.scalars().first()
+        ))
+        row = result.first()
+        return TaskView(**row._mapping) if row else None
+
 
 async def get_submitted_task_with_relations(
     submitted_task_id: int,
 ) -> SubmittedTask | None:
-    async with async_session() as session:
+    async with get_session() as session:
         result = await session.execute(
             select(SubmittedTask)
             .options(
@@ -136,4 +133,89 @@ async def get_submitted_task_with_relations(
             .where(SubmittedTask.id == submitted_task_id)
             .limit(1)
         )
-        return result.scalars().first()
\ No newline at end of file
+        return result.scalars().first()
+
+
+async def get_telegram_file_ids(etags: dict[str, str]) -> dict[str, str]:
+    """По словарю {s3_key: etag} возвращает {s3_key: file_id} для файлов,
+    которые уже отправлялись в Telegram и с тех пор не менялись."""
+    if not etags:
+        return {}
+    keys = list(etags)
+    async with get_read_session() as session:
+        result = await session.execute(lambda_stmt(
+            lambda: select(TelegramFile.s3_key, TelegramFile.etag,
+                           TelegramFile.file_id)
+            .where(TelegramFile.s3_key.in_(keys))
+        ))
+        return {
+            s3_key: file_id
+            for s3_key, etag, file_id in result.all()
+            if etags[s3_key] == etag
+        }
+
+
+async def save_telegram_file_ids(files: list[dict]):
+    """Запоминает file_id для файлов вида {"key", "etag", "file_id"}."""
+    if not files:
+        return
+    stmt = insert(TelegramFile).values([
+        {"s3_key": f["key"], "etag": f["etag"], "file_id": f["file_id"]}
+        for f in files
+    ])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[TelegramFile.s3_key],
+        set_={"etag": stmt.excluded.etag, "file_id": stmt.excluded.file_id},
+    )
+    async with get_session() as session:
+        await session.execute(stmt)
+        await session.commit()
+
+
+# Запрос без параметров строим один раз при импорте
+CATALOG_VERSION_QUERY = select(*[
+    column
+    for model in (Course, Task, Teacher)
+    for column in (
+        select(func.count(model.id)).scalar_subquery(),
+        select(func.coalesce(func.max(model.id), 0)).scalar_subquery(),
+    )
+])
+
+
+async def get_catalog_version() -> tuple[int, ...]:
+    """Количество и максимальный id курсов, заданий и преподавателей
+    одним запросом — дешёвая проверка, изменился ли справочник."""
+    async with get_read_session() as session:
+        result = await session.execute(CATALOG_VERSION_QUERY)
+        return tuple(result.one())
+
+
+async def get_catalog_rows(
+        min_course_id: int = 0, min_task_id: int = 0, min_teacher_id: int = 0,
+) -> tuple[list[Course], list[Task], list[Teacher]]:
+    """Курсы, задания и преподаватели с id больше переданных."""
+    async with get_read_session() as session:
+        courses = await session.execute(
+            select(Course).where(Course.id > min_course_id)
+            .order_by(Course.id))
+        tasks = await session.execute(
+            select(Task).where(Task.id > min_task_id).order_by(Task.id))
+        teachers = await session.execute(
+            select(Teacher).where(Teacher.id > min_teacher_id)
+            .order_by(Teacher.id))
+        return (courses.scalars().all(), tasks.scalars().all(),
+                teachers.scalars().all())
+
+
+async def get_alert_backlog() -> tuple[int, int]:
+    """Сколько строк в очереди уведомлений и сколько из них в аренде."""
+    async with get_session() as session:
+        result = await session.execute(
+            select(
+                func.count(SubmittedTaskOnChange.id),
+                func.count(SubmittedTaskOnChange.id).filter(
+                    SubmittedTaskOnChange.claimed_until > func.now()),
+            )
+        )
+        return tuple(result.one())
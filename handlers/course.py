@@ -1,49 +1,38 @@
 from aiogram.fsm.context import FSMContext
 from aiogram import Router, types
-from aiogram.types import (ReplyKeyboardRemove, ReplyKeyboardMarkup,
-                           KeyboardButton)
-from database.request import get_topics_by_course_id
-from keyboards.reply import go_home
+from aiogram.types import ReplyKeyboardRemove
+from states.data import UserData
 from states.register import CourseSelect, LessonSelect
+from utils.catalog import CATALOG
+from utils.identity import StudentIdentity
 
 router = Router()
 
 
 @router.message(CourseSelect.waiting_for_course)
-async def handle_course_choice(message: types.Message, state: FSMContext):
-    data = await state.get_data()
-    course_map: dict = data.get("course_map", {})
-
+async def handle_course_choice(message: types.Message, state: FSMContext,
+                               identity: StudentIdentity):
     selected_name = message.text.strip()
+    course = await CATALOG.find_course(identity.course_ids, selected_name)
 
-    if selected_name not in course_map:
+    if course is None:
         await message.answer("Выбери курс из списка.")
         return
 
-    course_id = course_map[selected_name]
-    await state.update_data(course_id=course_id)
+    await UserData.update(state, course_id=course.id)
 
     await message.answer(f"Курс «{selected_name}» выбран",
                          reply_markup=ReplyKeyboardRemove())
 
-    await show_course_topics(message, course_id, state)
+    await show_course_topics(message, course.id, state)
     await state.set_state(LessonSelect.waiting_for_topic)
 
 
 async def show_course_topics(message: types.Message, course_id: int,
                              state: FSMContext):
-    task_list = await get_topics_by_course_id(course_id)
-    task_dict = dict()
-    for task in task_list:
-        task_dict[task.topic] = task
-    await state.update_data(tasks=task_dict)
-    if not task_list:
+    kb = await CATALOG.topics_keyboard(course_id)
+    if kb is None:
         await message.answer("Тем по этому курсу пока нет.")
         return
 
-    task_name_to_task_id = {task.topic: task.id for task in task_list}
-    await state.update_data(task_name_to_task_id=task_name_to_task_id)
-    buttons = [[KeyboardButton(text=task.topic)] for task in task_list] + go_home
-    kb = ReplyKeyboardMarkup(keyboard=buttons, resize_keyboard=True)
-
     await message.answer("Вот доступные темы:", reply_markup=kb)
@@ -3,10 +3,12 @@ from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.types import KeyboardButton, ReplyKeyboardMarkup
 
-from database.request import get_available_courses_for_student
+from states.data import UserData
 from states.register import Lesson, CourseSelect, LessonSelect
 from handlers.course import show_course_topics
 from keyboards.reply import helm_button, go_home
+from utils.catalog import CATALOG
+from utils.identity import StudentIdentity
 
 router = Router()
 
@@ -28,44 +30,39 @@ async def cmd_start(message: types.Message):
 
 
 @router.message(lambda m: m.text == "📝 Темы домашних заданий")
-async def get_lesson(message: types.Message, state: FSMContext):
-    data = await state.get_data()
-    if "course_id" not in data:
-        courses = await get_available_courses_for_student(message.from_user.id)
+async def get_lesson(message: types.Message, state: FSMContext,
+                     identity: StudentIdentity):
+    data = await UserData.load(state)
+    if data.course_id is None:
+        courses = await CATALOG.courses(identity.course_ids)
 
         if not courses:
             await message.answer(
                 "У тебя нет доступных курсов. Обратись к преподавателю.")
             return
 
-        course_map = {course.name: course.id for course in courses}
-        await state.update_data(course_map=course_map)
-        buttons = [[KeyboardButton(text=name)] for name in course_map.keys()]
+        buttons = [[KeyboardButton(text=course.name)] for course in courses]
         kb = ReplyKeyboardMarkup(keyboard=buttons, resize_keyboard=True)
         await message.answer("Ты ещё не выбрал курс. Выбери один из доступных:",
                              reply_markup=kb)
         await state.set_state(CourseSelect.waiting_for_course)
     else:
-        course_id = data["course_id"]
-        await show_course_topics(message, course_id, state)
+        await show_course_topics(message, data.course_id, state)
         await state.set_state(LessonSelect.waiting_for_topic)
 
 
 @router.message(lambda m: m.text == "📚 Выбрать курс")
-async def get_my_course(message: types.Message, state: FSMContext):
-    courses = await get_available_courses_for_student(message.from_user.id)
+async def get_my_course(message: types.Message, state: FSMContext,
+                        identity: StudentIdentity):
+    courses = await CATALOG.courses(identity.course_ids)
 
     if not courses:
         await message.answer(
             "У тебя пока нет доступных курсов. Обратись к преподавателю.")
         return
 
-    course_map = {course.name: course.id for course in courses}
-    await state.update_data(course_map=course_map)
-
     buttons = [[KeyboardButton(text=course.name)] for course in courses] + go_home
     kb = ReplyKeyboardMarkup(keyboard=buttons, resize_keyboard=True)
 
     await message.answer("Вот твои доступные курсы", reply_markup=kb)
     await state.set_state(CourseSelect.waiting_for_course)
-
@@ -1,101 +1,101 @@
-from collections import defaultdict
 from zoneinfo import ZoneInfo
 
 from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State
 from aiogram import Router, types, F, Bot
 from aiogram.types import InputMediaDocument, BufferedInputFile
 
-from database.models import Task
 from handlers.globalСommands import cmd_help
-from yandexAPI.loader import upload_all_or_none, get_files_by_mask
-from database.request import save_submission_to_db, has_student_submitted, \
-    get_task_by_id, get_last_work
+from yandexAPI.loader import upload_all_or_none, list_files_by_mask, \
+    fetch_files
+from database.request import save_submission_to_db, get_task_view, \
+    TaskView, get_telegram_file_ids, save_telegram_file_ids
 from handlers.course import show_course_topics
 from keyboards.reply import send_or_select_topic, back_to_topics_kb, skip_pdf_kb, skip_code_kb
+from states.data import UserData
 from states.register import LessonSelect
+from config import ALBUM_DEBOUNCE, ALBUM_MAX_FILES, ALBUM_MAX_AGE, \
+    ALBUM_MAX_GROUPS
+from utils.album import AlbumCache
 from utils.auth import get_mask_for_save
+from utils.catalog import CATALOG
+from utils.metrics import step
 
 router = Router()
-album_cache: dict[str, list[types.Message]] = defaultdict(list)
+album_cache = AlbumCache(debounce=ALBUM_DEBOUNCE, max_age=ALBUM_MAX_AGE,
+                         max_groups=ALBUM_MAX_GROUPS)
 
 
 @router.message(LessonSelect.waiting_for_topic)
 async def handle_topic_selection(message: types.Message, state: FSMContext):
-    data = await state.get_data()
-    student_id = data.get("student_id")
+    data = await UserData.load(state)
+    student_id = data.student_id
     topic_name = message.text.strip()
-    task_id = data.get("task_name_to_task_id", {}).get(topic_name, None)
-    if not task_id:
+    task = await CATALOG.find_task(data.course_id, topic_name)
+    if not task:
         await message.answer("Такой темы нет. Выбери из списка.")
         return
-    await state.update_data(task_id=task_id)
-    await state.update_data(topic_name=topic_name)
-    task = await get_task_by_id(task_id)
-    submitted_task = await has_student_submitted(student_id, task_id)
-    if not submitted_task:
-        if task:
-            await message.answer(
-                f"Ты еще не отправлял решение задач по этой теме\n"
-                f"📚 Тема: {task.topic}\n"
-                f"🔗 Ссылка на задачи {task.task_link}\n"
-                f"📅 Дедлайн: {task.deadline.strftime('%d.%m.%Y') if task.deadline else '—'}\n"
-                f"👤 Преподаватель: {task.teacher.name} {task.teacher.telegram_nickname}\n"
-            )
-        else:
-            await message.answer("Задание не найдено.")
-    else:
-        await print_task_information(
-            message=message,
-            state=state,
-            task=task,
-            is_new_load=True,
+    task_id = task.id
+    await UserData.update(state, task_id=task_id)
+    with step("task_view"):
+        view = await get_task_view(student_id, task_id)
+    if view is None:
+        await message.answer("Задание не найдено.")
+    elif not view.submitted:
+        await message.answer(
+            f"Ты еще не отправлял решение задач по этой теме\n"
+            f"📚 Тема: {view.topic}\n"
+            f"🔗 Ссылка на задачи {view.task_link}\n"
+            f"📅 Дедлайн: {view.deadline.strftime('%d.%m.%Y') if view.deadline else '—'}\n"
+            f"👤 Преподаватель: {view.teacher_name} {view.teacher_nickname}\n"
         )
+    else:
+        await print_task_information(message, view)
 
     await message.answer("Что ты хочешь сделать дальше?",
                          reply_markup=send_or_select_topic)
     await state.set_state(LessonSelect.after_topic)
 
 
-async def print_task_information(message: types.Message, state: FSMContext, task: Task, is_new_load):
+async def show_submission(message: types.Message, student_id: int,
+                          task_id: int):
+    """Показывает только что сохранённую работу студента."""
+    with step("task_view"):
+        view = await get_task_view(student_id, task_id)
+    if view is None or not view.submitted:
+        await message.answer("Технические неполадки, попробуй еще раз")
+        return
+    await print_task_information(message, view)
+
+
+async def print_task_information(message: types.Message, view: TaskView):
     await message.answer(
         "Загрузка твоей работы, может занять некоторое время, подожди пожалуйста")
-    data = await state.get_data()
-    task_id = data["task_id"]
-    student_id = data.get("student_id")
-    last_work = await get_last_work(student_id, task_id)
-
-    topic = last_work.task.topic
-    deadline = last_work.task.deadline
-    teacher_name = last_work.task.teacher.name
-    tg_nick = last_work.task.teacher.telegram_nickname
-    comment = last_work.comment
-    status_name = last_work.status.name
-    grade = last_work.grade
+
+    comment = view.comment
+    grade = view.grade
 
     ekb_tz = ZoneInfo("Asia/Yekaterinburg")
-    last_sent_at = last_work.last_modified_date.astimezone(ekb_tz).strftime("%d.%m.%Y %H:%M")
-    first_sent = last_work.submitted_date.astimezone(ekb_tz).strftime("%d.%m.%Y %H:%M")
-    #last_sent_at = last_work.last_modified_date.strftime("%d.%m.%Y %H:%M")
-    #first_sent = last_work.submitted_date.strftime("%d.%m.%Y %H:%M")
+    last_sent_at = view.last_modified_date.astimezone(ekb_tz).strftime("%d.%m.%Y %H:%M")
+    first_sent = view.submitted_date.astimezone(ekb_tz).strftime("%d.%m.%Y %H:%M")
 
     text = (
-        f"📚 Тема: {topic}\n"
-        f"🔗 Ссылка на задачи {task.task_link}\n"
-        f"📅 Дедлайн: {deadline.strftime('%d.%m.%Y')}\n"
-        f"👤 Преподаватель: {teacher_name}  {tg_nick}\n"
-        f"📌 Статус: {status_name}\n"
+        f"📚 Тема: {view.topic}\n"
+        f"🔗 Ссылка на задачи {view.task_link}\n"
+        f"📅 Дедлайн: {view.deadline.strftime('%d.%m.%Y')}\n"
+        f"👤 Преподаватель: {view.teacher_name}  {view.teacher_nickname}\n"
+        f"📌 Статус: {view.status_name}\n"
         f"📨 Последняя отправка: {last_sent_at}\n"
         f"📬 Дата первой сдачи работы: {first_sent}\n"
     )
 
-    # print(last_verified_work)
-    if last_work.status_id == 1:
+    if view.status_id == 1:
         # Рабрту проверили
         checking_messages = f"🟢 Твою работу проверили! 🟢\n📝 Оценка: {grade}\n"
         checking_messages += f"💬 Комментарий: {comment}\n\n" if comment else "\n"
         text = checking_messages + text
-    elif last_work.submitted_date != last_work.last_modified_date and last_work.grade is not None:
-        # last_work.status_id = 0, потому что мы уже отпарвли исправления на проверку, но старая оценка то есть
+    elif view.submitted_date != view.last_modified_date and grade is not None:
+        # status_id = 0, потому что мы уже отпарвли исправления на проверку, но старая оценка то есть
         refactor_massage = (
             "❗️ Исправления по заданию успешно отправлены.❗️\n"
             f"👉 Результаты проверки предыдущего решения:\n"
@@ -104,24 +104,58 @@ async def print_task_information(message: types.Message, state: FSMContext, task
         refactor_massage += f"💬 Комментарий: {comment}\n\n" if comment else "\n"
         text = refactor_massage + text
 
-    if last_work.code_url:
-        text += f"💻 Ссылка на код: {last_work.code_url}\n"
+    if view.code_url:
+        text += f"💻 Ссылка на код: {view.code_url}\n"
 
-    prefix = last_work.homework_prefix
+    prefix = view.homework_prefix
     if prefix:
-        files = await get_files_by_mask(prefix)
-        await send_files_with_caption(files, message.bot, message.chat.id, text)
-    elif last_work.code_url:
+        with step("load_files"):
+            files = await load_stored_files(prefix)
+        if files is None:
+            await message.answer("Технические неполадки, попробуй еще раз")
+            return
+        with step("send_files"):
+            await send_files_with_caption(files, message.bot,
+                                          message.chat.id, text)
+    elif view.code_url:
         await message.answer(text)
     else:
         await message.answer("Технические неполадки, попробуй еще раз")
 
 
+async def load_stored_files(prefix: str) -> list[dict] | None:
+    """Файлы работы из S3. Те, что уже отправлялись в Telegram и не
+    менялись, возвращаются с file_id и не скачиваются заново."""
+    files = await list_files_by_mask(prefix)
+    if files is None:
+        return None
+
+    try:
+        file_ids = await get_telegram_file_ids(
+            {file["key"]: file["etag"] for file in files})
+    except Exception as e:
+        print(f"Не удалось получить file_id из базы: {e}")
+        file_ids = {}
+    for file in files:
+        file["file_id"] = file_ids.get(file["key"])
+
+    missing = [file for file in files if file["file_id"] is None]
+    fetched = await fetch_files(missing) if missing else []
+    if fetched is None:
+        return None
+    fetched_by_key = {file["key"]: file for file in fetched}
+    return [fetched_by_key.get(file["key"], file) for file in files]
+
+
 async def send_files_with_caption(
         files: list[dict], bot: Bot, chat_id: int, caption: str):
     await bot.send_message(chat_id=chat_id, text=caption)
     media = []
     for i, file in enumerate(files):
+        if file.get("file_id"):
+            media.append(InputMediaDocument(media=file["file_id"]))
+            continue
+
         buffer = file["buffer"]
         filename = file["filename"]
 
@@ -133,15 +167,26 @@ async def send_files_with_caption(
         media_doc = InputMediaDocument(media=input_file)
         media.append(media_doc)
 
-    await bot.send_media_group(chat_id=chat_id, media=media)
+    messages = await bot.send_media_group(chat_id=chat_id, media=media)
+
+    # Запоминаем file_id загруженных файлов, чтобы в следующий раз не
+    # тянуть их из S3
+    uploaded = [
+        {**file, "file_id": sent.document.file_id}
+        for file, sent in zip(files, messages)
+        if not file.get("file_id") and sent.document and "key" in file
+    ]
+    try:
+        await save_telegram_file_ids(uploaded)
+    except Exception as e:
+        print(f"Не удалось сохранить file_id: {e}")
 
 
 @router.message(LessonSelect.after_topic)
 async def handle_reselect_topic(message: types.Message, state: FSMContext):
     if message.text == "Выбрать другую тему":
-        data = await state.get_data()
-        course_id = data.get("course_id")
-        await show_course_topics(message, course_id, state)
+        data = await UserData.load(state)
+        await show_course_topics(message, data.course_id, state)
         await state.set_state(LessonSelect.waiting_for_topic)
         return
 
@@ -157,14 +202,14 @@ async def handle_reselect_topic(message: types.Message, state: FSMContext):
         await state.set_state(LessonSelect.after_topic)
         return
 
-    data = await state.get_data()
-    task_id = data.get("task_id")
+    data = await UserData.load(state)
+    task_id = data.task_id
     if not task_id:
         await message.answer("Сначала выбери тему задания.")
         await state.set_state(LessonSelect.waiting_for_topic)
         return
 
-    task = await get_task_by_id(task_id)
+    task = await CATALOG.task(task_id)
 
     if not task.need_code:
         await message.answer(
@@ -175,7 +220,7 @@ async def handle_reselect_topic(message: types.Message, state: FSMContext):
         await state.set_state(LessonSelect.waiting_for_files)
         return
 
-    await state.update_data(submitted_files=None, code_url=None)
+    await UserData.update(state, submitted_files=[], code_url=None)
 
     await message.answer(
         "На это задание можно отправть PDF или ссылку на Google Colab c кодом!\n\n"
@@ -187,15 +232,14 @@ async def handle_reselect_topic(message: types.Message, state: FSMContext):
 
 @router.message(LessonSelect.waiting_for_pdf_optional, F.text == "⬅️ К темам")
 async def back_to_topics_from_pdf(message: types.Message, state: FSMContext):
-    data = await state.get_data()
-    await show_course_topics(message, data.get("course_id"), state)
+    data = await UserData.load(state)
+    await show_course_topics(message, data.course_id, state)
     await state.set_state(LessonSelect.waiting_for_topic)
 
 
 @router.message(LessonSelect.waiting_for_pdf_optional, F.text == "⏭ Пропустить PDF")
 async def skip_pdf(message: types.Message, state: FSMContext):
-    await state.update_data(is_uploaded_file=False)
-    await state.update_data(submitted_files=None)
+    await UserData.update(state, is_uploaded_file=False, submitted_files=[])
 
     await message.answer(
         "Ок, PDF пропускаем.\n\n"
@@ -205,36 +249,90 @@ async def skip_pdf(message: types.Message, state: FSMContext):
     await state.set_state(LessonSelect.waiting_for_code_url_optional)
 
 
+@router.message(LessonSelect.waiting_for_pdf_optional, F.document,
+                F.media_group_id)
+async def take_optional_pdf_album(message: types.Message, state: FSMContext):
+    async def on_album(messages: list[types.Message]):
+        if await still_in(state, LessonSelect.waiting_for_pdf_optional):
+            await accept_optional_pdfs(messages, state)
+
+    if not album_cache.add(message, on_album):
+        await answer_late_album_part(message)
+
+
 @router.message(LessonSelect.waiting_for_pdf_optional, F.document)
-async def take_optional_pdf(message: types.Message, state: FSMContext, bot: Bot):
-    file_name = message.document.file_name.lower()
-    if not file_name.endswith(".pdf"):
+async def take_optional_pdf(message: types.Message, state: FSMContext):
+    await accept_optional_pdfs([message], state)
+
+
+async def accept_optional_pdfs(messages: list[types.Message],
+                               state: FSMContext):
+    message = messages[0]
+    if not all(is_pdf(m) for m in messages):
         await message.answer("На этом шаге принимаю только PDF или «⏭ Пропустить PDF».")
         return
+    if not await check_album_size(messages):
+        return
 
     mask_prefix = await get_mask_for_save(state)
-    files = [{
-        "file_id": message.document.file_id,
-        "original_file_name": message.document.file_name,
-        "mask_for_save": mask_prefix
-    }]
+    files = files_from_messages(messages, mask_prefix)
 
-    ok = await upload_all_or_none(files, bot)
+    with step("upload"):
+        ok = await upload_all_or_none(files, message.bot)
     if not ok:
         await message.answer("Не удалось загрузить PDF. Попробуй ещё раз или пропусти.")
         return
 
-    await state.update_data(submitted_files=files)
+    await UserData.update(state,
+                          submitted_files=[f["file_id"] for f in files])
 
     await message.answer(
-        "PDF принят ✅\n\n"
+        ("PDF принят ✅" if len(files) == 1
+         else f"PDF приняты ({len(files)} шт.) ✅") + "\n\n"
         "Теперь пришли ссылку на код (Google Colab) или нажми «⏭ Пропустить ссылку».",
         reply_markup=skip_code_kb
     )
-    await state.update_data(is_uploaded_file=True)
+    await UserData.update(state, is_uploaded_file=True)
     await state.set_state(LessonSelect.waiting_for_code_url_optional)
 
 
+async def still_in(state: FSMContext, expected: State) -> bool:
+    # Пока собирался альбом, студент мог уйти с этого шага
+    return await state.get_state() == expected.state
+
+
+async def check_album_size(messages: list[types.Message]) -> bool:
+    # Альбом принимается только целиком: часть файлов не загружаем
+    if len(messages) <= ALBUM_MAX_FILES:
+        return True
+    await messages[0].answer(
+        f"В одной отправке можно не больше {ALBUM_MAX_FILES} файлов, "
+        f"а в альбоме {len(messages)}. Ничего не сохранено — "
+        f"отправь файлы заново.")
+    return False
+
+
+async def answer_late_album_part(message: types.Message):
+    await message.answer(
+        f"Файл «{message.document.file_name}» пришёл уже после того, как "
+        f"альбом был принят, и не сохранён. Отправь альбом целиком заново.")
+
+
+def is_pdf(message: types.Message) -> bool:
+    return bool(message.document and message.document.file_name
+                and message.document.file_name.lower().endswith(".pdf"))
+
+
+def files_from_messages(messages: list[types.Message],
+                        mask_prefix: str) -> list[dict]:
+    return [{
+        "file_id": m.document.file_id,
+        "file_unique_id": m.document.file_unique_id,
+        "original_file_name": m.document.file_name,
+        "mask_for_save": mask_prefix
+    } for m in messages]
+
+
 @router.message(LessonSelect.waiting_for_pdf_optional)
 async def reject_pdf_optional_other(message: types.Message):
     await message.answer("Отправь один PDF или нажми «⏭ Пропустить PDF».")
@@ -242,23 +340,21 @@ async def reject_pdf_optional_other(message: types.Message):
 
 @router.message(LessonSelect.waiting_for_code_url_optional, F.text == "⬅️ К темам")
 async def back_to_topics_from_code(message: types.Message, state: FSMContext):
-    data = await state.get_data()
-    await show_course_topics(message, data.get("course_id"), state)
+    data = await UserData.load(state)
+    await show_course_topics(message, data.course_id, state)
     await state.set_state(LessonSelect.waiting_for_topic)
 
 
 @router.message(LessonSelect.waiting_for_code_url_optional, F.text == "⏭ Пропустить ссылку")
 async def skip_code_url(message: types.Message, state: FSMContext):
-    data = await state.get_data()
-    files = data.get("submitted_files")
-    code_url = data.get("code_url")
+    data = await UserData.load(state)
 
-    if not files and not code_url:
+    if not data.submitted_files and not data.code_url:
         await message.answer(
             "Ты пропустил и PDF, и ссылку — значит ничего не отправил.\n"
             "Работа не сдана. Возвращаю к темам."
         )
-        await show_course_topics(message, data.get("course_id"), state)
+        await show_course_topics(message, data.course_id, state)
         await state.set_state(LessonSelect.waiting_for_topic)
         return
 
@@ -272,7 +368,7 @@ async def take_code_url(message: types.Message, state: FSMContext):
         await message.answer("Пришли ссылку (http/https) или нажми «⏭ Пропустить ссылку».")
         return
 
-    await state.update_data(code_url=url)
+    await UserData.update(state, code_url=url)
     await finalize_submission(message, state)
 
 
@@ -282,17 +378,15 @@ async def reject_code_other(message: types.Message):
 
 
 async def finalize_submission(message: types.Message, state: FSMContext):
-    data = await state.get_data()
-    student_id = data.get("student_id")
-    task_id = data.get("task_id")
-    code_url = data.get("code_url")
-    is_uploaded_file = data.get("is_uploaded_file", False)
-    mask_prefix = await get_mask_for_save(state) if is_uploaded_file else None
+    data = await UserData.load(state)
+    student_id = data.student_id
+    task_id = data.task_id
+    code_url = data.code_url
+    mask_prefix = await get_mask_for_save(state) if data.is_uploaded_file else None
     print("finalize_submission", "student_id:", student_id, "task_id:", task_id, "code_url:", code_url, "mask_prefix", mask_prefix)
-    await save_submission_to_db(student_id, task_id, mask_prefix, code_url=code_url)
-
-    task = await get_task_by_id(task_id)
-    await print_task_information(message, state, task, is_new_load=False)
+    with step("save_submission"):
+        await save_submission_to_db(student_id, task_id, mask_prefix, code_url=code_url)
+    await show_submission(message, student_id, task_id)
 
     await message.answer("Готово ✅ Что дальше?", reply_markup=send_or_select_topic)
     await state.set_state(LessonSelect.after_topic)
@@ -300,25 +394,42 @@ async def finalize_submission(message: types.Message, state: FSMContext):
 
 @router.message(LessonSelect.waiting_for_files, F.text == "⬅️ К темам")
 async def back_to_topics_from_files(message: types.Message, state: FSMContext):
-    data = await state.get_data()
-    await show_course_topics(message, data.get("course_id"), state)
+    data = await UserData.load(state)
+    await show_course_topics(message, data.course_id, state)
     await state.set_state(LessonSelect.waiting_for_topic)
 
 
+@router.message(LessonSelect.waiting_for_files, F.document, F.media_group_id)
+async def handle_get_album(message: types.Message, state: FSMContext):
+    async def on_album(messages: list[types.Message]):
+        if await still_in(state, LessonSelect.waiting_for_files):
+            await accept_album(messages, state)
+
+    if not album_cache.add(message, on_album):
+        await answer_late_album_part(message)
+
+
+async def accept_album(messages: list[types.Message], state: FSMContext):
+    message = messages[0]
+    if not all(is_pdf(m) for m in messages):
+        await message.answer("В альбоме должны быть только файлы формата .pdf. Попробуй ещё раз.")
+        return
+    if not await check_album_size(messages):
+        return
+    mask_prefix = await get_mask_for_save(state)
+    files = files_from_messages(messages, mask_prefix)
+    await after_accepting_files(files, message, state, mask_prefix)
+
+
 @router.message(LessonSelect.waiting_for_files, F.document)
 async def handle_get_single_file(message: types.Message, state: FSMContext):
-    file_name = message.document.file_name.lower()
-    if not file_name.endswith(".pdf"):
+    if not is_pdf(message):
         await message.answer("Принимается только один файл формата .pdf. Попробуй ещё раз.")
         return
 
     mask_prefix = await get_mask_for_save(state)
-    file = {
-        "file_id": message.document.file_id,
-        "original_file_name": message.document.file_name,
-        "mask_for_save": mask_prefix
-    }
-    await after_accepting_files([file], message, state, mask_prefix)
+    files = files_from_messages([message], mask_prefix)
+    await after_accepting_files(files, message, state, mask_prefix)
 
 
 @router.message(LessonSelect.waiting_for_files)
@@ -327,20 +438,22 @@ async def reject_non_files(message: types.Message):
 
 
 async def after_accepting_files(files, message, state, mask_prefix):
-    data = await state.get_data()
-    student_id = data.get("student_id")
-    task_id = data.get("task_id")
-    code_url = data.get("code_url")
-    state.update_data(code_url=None) # Мы в ветке только с файлами
+    data = await UserData.load(state)
+    student_id = data.student_id
+    task_id = data.task_id
+    code_url = data.code_url
+    await UserData.update(state, code_url=None) # Мы в ветке только с файлами
     bot = message.bot
-    is_ok_load = await upload_all_or_none(files, bot)
+    with step("upload"):
+        is_ok_load = await upload_all_or_none(files, bot)
     if is_ok_load:
-        task = await get_task_by_id(task_id)
         print("after_accepting_files", "student_id:", student_id, "task_id:", task_id, "code_url:", code_url,
               "mask_prefix", mask_prefix)
-        await save_submission_to_db(student_id, task_id, mask_prefix, code_url=None) # Передам code_url=None чтобы точно затереть
-        await state.update_data(submitted_files=files)
-        await print_task_information(message, state, task, is_new_load=False)
+        with step("save_submission"):
+            await save_submission_to_db(student_id, task_id, mask_prefix, code_url=None) # Передам code_url=None чтобы точно затереть
+        await UserData.update(state,
+                              submitted_files=[f["file_id"] for f in files])
+        await show_submission(message, student_id, task_id)
         await message.answer("Что ты хочешь сделать дальше?",
                              reply_markup=send_or_select_topic)
         await state.set_state(LessonSelect.after_topic)
@@ -35,3 +35,8 @@ skip_code_kb = ReplyKeyboardMarkup(
               [KeyboardButton(text="⬅️ К темам")]],
     resize_keyboard=True
 )
+
+
+def topics_keyboard(topics: list[str]) -> ReplyKeyboardMarkup:
+    buttons = [[KeyboardButton(text=topic)] for topic in topics] + go_home
+    return ReplyKeyboardMarkup(keyboard=buttons, resize_keyboard=True)
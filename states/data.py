@@ -0,0 +1,38 @@
+from dataclasses import dataclass, field, fields
+
+from aiogram.fsm.context import FSMContext
+
+
+@dataclass(slots=True)
+class UserData:
+    """Схема данных пользователя в FSM.
+
+    Храним только id и флаги: названия курсов и тем берутся из общего
+    справочника (utils.catalog), а ORM-объекты в состояние не попадают.
+    Так состояние занимает мало памяти и сериализуется в JSON.
+    """
+    user_id: int | None = None
+    student_id: int | None = None
+    fio: str | None = None
+    course_id: int | None = None
+    task_id: int | None = None
+    code_url: str | None = None
+    is_uploaded_file: bool = False
+    # file_id принятых PDF текущей отправки
+    submitted_files: list[str] = field(default_factory=list)
+
+    @classmethod
+    async def load(cls, state: FSMContext) -> "UserData":
+        data = await state.get_data()
+        return cls(**{name: data[name] for name in FIELD_NAMES
+                      if name in data})
+
+    @staticmethod
+    async def update(state: FSMContext, **values):
+        unknown = values.keys() - FIELD_NAMES
+        if unknown:
+            raise KeyError(f"Неизвестные поля состояния: {sorted(unknown)}")
+        await state.update_data(**values)
+
+
+FIELD_NAMES = frozenset(f.name for f in fields(UserData))
@@ -0,0 +1,182 @@
+import asyncio
+from collections import Counter
+
+from conftest import seed_submissions
+
+
+class FakeBot:
+    """Вместо Telegram запоминает, в какие чаты ушли сообщения."""
+
+    def __init__(self, sent: Counter):
+        self.sent = sent
+
+    async def send_message(self, chat_id: int, text: str):
+        # Пауза, чтобы воркеры успели пересечься по времени
+        await asyncio.sleep(0.002)
+        self.sent[chat_id] += 1
+
+
+async def enqueue(submitted_task_ids: list[int]):
+    from sqlalchemy import insert
+
+    from database.connect import async_session
+    from database.models import SubmittedTaskOnChange
+
+    async with async_session() as session:
+        await session.execute(insert(SubmittedTaskOnChange), [
+            {"submitted_task_id": i} for i in submitted_task_ids])
+        await session.commit()
+
+
+async def queue_size() -> int:
+    from sqlalchemy import select, func
+
+    from database.connect import async_session
+    from database.models import SubmittedTaskOnChange
+
+    async with async_session() as session:
+        return await session.scalar(
+            select(func.count(SubmittedTaskOnChange.id)))
+
+
+async def drain(delivery) -> int:
+    from utils.alerts import drain_once
+
+    total = 0
+    while processed := await drain_once(delivery):
+        total += processed
+    return total
+
+
+def test_parallel_drainers_send_each_change_once(db):
+    from utils.delivery import Delivery
+
+    async def scenario():
+        pairs = await seed_submissions(500)
+        await enqueue([i for i, _ in pairs])
+        sent = Counter()
+        deliveries = [Delivery(FakeBot(sent), rate=100_000, chat_interval=0)
+                      for _ in range(4)]
+        drained = await asyncio.gather(*(drain(d) for d in deliveries))
+        return pairs, sent, drained, await queue_size()
+
+    pairs, sent, drained, left = db(scenario())
+    assert left == 0
+    assert sum(drained) == len(pairs)
+    # Пачки разошлись по нескольким воркерам
+    assert sum(1 for n in drained if n) > 1
+    assert sent == Counter({telegram_id: 1 for _, telegram_id in pairs})
+
+
+def test_expired_claim_is_taken_by_another_drainer(db):
+    from sqlalchemy import update, func
+
+    from database.connect import async_session
+    from database.models import SubmittedTaskOnChange
+    from utils.alerts import claim_changes_query
+    from utils.delivery import Delivery
+
+    async def scenario():
+        pairs = await seed_submissions(3)
+        await enqueue([i for i, _ in pairs])
+        # Воркер арендовал строки и упал, ничего не отправив
+        async with async_session() as session:
+            await session.execute(claim_changes_query(10))
+            await session.commit()
+        sent = Counter()
+        delivery = Delivery(FakeBot(sent), rate=100_000, chat_interval=0)
+        while_claimed = await drain(delivery)
+        async with async_session() as session:
+            await session.execute(
+                update(SubmittedTaskOnChange)
+                .values(claimed_until=func.now()))
+            await session.commit()
+        after_expiry = await drain(delivery)
+        return pairs, sent, while_claimed, after_expiry
+
+    pairs, sent, while_claimed, after_expiry = db(scenario())
+    assert while_claimed == 0
+    assert after_expiry == len(pairs)
+    assert sent == Counter({telegram_id: 1 for _, telegram_id in pairs})
+
+
+def test_nothing_is_sent_after_the_lease_ends(db, monkeypatch):
+    import utils.alerts
+    from utils.delivery import Delivery
+
+    # Аренда кончается сразу после захвата строк
+    monkeypatch.setattr(utils.alerts, "ALERT_CLAIM_TIMEOUT", 0)
+
+    async def scenario():
+        pairs = await seed_submissions(3)
+        await enqueue([i for i, _ in pairs])
+        sent = Counter()
+        delivery = Delivery(FakeBot(sent), rate=100_000, chat_interval=0)
+        processed = await utils.alerts.drain_once(delivery)
+        return sent, processed, await queue_size()
+
+    sent, processed, left = db(scenario())
+    assert not sent
+    assert processed == 0
+    assert left == 3
+
+
+def test_queue_insert_wakes_the_listener(db):
+    from database.notify import CHANGES_CHANNEL, listen
+
+    async def scenario():
+        pairs = await seed_submissions(1)
+        wakeup = asyncio.Event()
+        listener = asyncio.create_task(listen(CHANGES_CHANNEL, wakeup.set))
+        try:
+            # listen() будит сразу после подключения — ждём и сбрасываем
+            await asyncio.wait_for(wakeup.wait(), timeout=10)
+            wakeup.clear()
+            await enqueue([pairs[0][0]])
+            await asyncio.wait_for(wakeup.wait(), timeout=10)
+        finally:
+            listener.cancel()
+            await asyncio.gather(listener, return_exceptions=True)
+
+    db(scenario())
+
+
+class BrokenBot:
+    """Telegram, который всё время отвечает временной ошибкой."""
+
+    async def send_message(self, chat_id: int, text: str):
+        raise RuntimeError("сеть недоступна")
+
+
+def test_failed_attempts_are_counted_in_queue(db, monkeypatch):
+    from sqlalchemy import select, update, func
+
+    from database.connect import async_session
+    from database.models import SubmittedTaskOnChange
+    from utils.alerts import drain_once
+    from utils.delivery import Delivery
+
+    monkeypatch.setattr("utils.alerts.ALERT_MAX_ATTEMPTS", 3)
+
+    async def attempts() -> list[int]:
+        async with async_session() as session:
+            return list(await session.scalars(
+                select(SubmittedTaskOnChange.attempts)))
+
+    async def scenario():
+        pairs = await seed_submissions(1)
+        await enqueue([pairs[0][0]])
+        seen = []
+        for _ in range(3):
+            # Каждый раз новый воркер: счётчик должен жить в базе
+            delivery = Delivery(BrokenBot(), rate=100_000, chat_interval=0)
+            await drain_once(delivery)
+            seen.append(await attempts())
+            # Не ждём паузу до повтора
+            async with async_session() as session:
+                await session.execute(update(SubmittedTaskOnChange).values(
+                    claimed_until=func.now()))
+                await session.commit()
+        return seen
+
+    assert db(scenario()) == [[1], [2], []]
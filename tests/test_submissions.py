@@ -0,0 +1,90 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from conftest import TEST_DATABASE_URL, seed_students
+
+
+async def submission_ids(student_id: int, task_id: int) -> list[int]:
+    from sqlalchemy import select
+
+    from database.connect import async_session
+    from database.models import SubmittedTask
+
+    async with async_session() as session:
+        result = await session.execute(
+            select(SubmittedTask.id)
+            .where(SubmittedTask.student_id == student_id,
+                   SubmittedTask.task_id == task_id))
+        return list(result.scalars())
+
+
+def test_parallel_submissions_keep_one_row(db):
+    from database.request import save_submission_to_db
+
+    async def scenario():
+        task_id, _, students = await seed_students(1)
+        student_id, _ = students[0]
+        # Первая отправка: все запросы гонятся за вставкой одной строки
+        ids = await asyncio.gather(*(
+            save_submission_to_db(student_id, task_id, f"p/{i}/", None)
+            for i in range(20)))
+        # Повторные отправки обновляют ту же строку
+        ids += await asyncio.gather(*(
+            save_submission_to_db(student_id, task_id, f"q/{i}/", None)
+            for i in range(20)))
+        return ids, await submission_ids(student_id, task_id)
+
+    ids, rows = db(scenario())
+    assert len(rows) == 1
+    assert set(ids) == set(rows)
+
+
+def test_migration_merges_duplicate_submissions(db):
+    from sqlalchemy import insert, select, text
+
+    from database.connect import async_session
+    from database.migrate import apply_migrations
+    from database.models import SubmittedTask, SubmittedTaskOnChange
+
+    async def scenario():
+        task_id, teacher_id, students = await seed_students(2)
+        now = datetime.now(timezone.utc)
+        async with async_session() as session:
+            # База до миграции: индекса нет, у первого студента дубли
+            await session.execute(text(
+                'DROP INDEX "UX_submitted_tasks_student_id_task_id"'))
+            await session.execute(text(
+                "DELETE FROM schema_migrations"
+                " WHERE name = '005_submitted_tasks_unique.sql'"))
+            first, second = students[0][0], students[1][0]
+            rows = [(first, now - timedelta(days=2)),
+                    (first, now),
+                    (first, now - timedelta(days=1)),
+                    (second, now)]
+            ids = []
+            for student_id, modified in rows:
+                ids.append(await session.scalar(
+                    insert(SubmittedTask).values(
+                        student_id=student_id, task_id=task_id,
+                        status_id=0, teacher_id=teacher_id, comment="",
+                        submitted_date=modified,
+                        last_modified_date=modified)
+                    .returning(SubmittedTask.id)))
+            await session.execute(insert(SubmittedTaskOnChange).values(
+                submitted_task_id=ids[0]))
+            await session.commit()
+
+        applied = await apply_migrations(TEST_DATABASE_URL)
+
+        async with async_session() as session:
+            remaining = list(await session.scalars(
+                select(SubmittedTask.id).order_by(SubmittedTask.id)))
+            queued = list(await session.scalars(
+                select(SubmittedTaskOnChange.submitted_task_id)))
+        return ids, applied, remaining, queued
+
+    ids, applied, remaining, queued = db(scenario())
+    assert applied == ["005_submitted_tasks_unique.sql"]
+    # У первого студента осталась последняя изменённая отправка
+    assert remaining == [ids[1], ids[3]]
+    assert queued == [ids[1]]
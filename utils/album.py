@@ -0,0 +1,119 @@
+import asyncio
+import contextvars
+import time
+from typing import Awaitable, Callable
+
+from aiogram import types
+
+AlbumCallback = Callable[[list[types.Message]], Awaitable[None]]
+
+# Больше сообщений в одном альбоме Telegram не присылает
+TELEGRAM_ALBUM_LIMIT = 10
+
+
+class Album:
+    __slots__ = ("messages", "callback", "created", "timer")
+
+    def __init__(self, callback: AlbumCallback):
+        self.messages: list[types.Message] = []
+        self.callback = callback
+        self.created = time.monotonic()
+        self.timer: asyncio.Task | None = None
+
+
+class AlbumCache:
+    """Собирает сообщения одного альбома (media_group_id).
+
+    Telegram присылает альбом отдельными сообщениями подряд. Каждое новое
+    сообщение откладывает обработку на debounce секунд, и когда сообщения
+    перестают приходить, callback получает весь альбом разом.
+
+    Обработка идёт в отдельной задаче с пустым контекстом: сессия БД и
+    трасса обновления, в котором пришло последнее сообщение, к этому
+    моменту уже закрыты. Альбомы старше max_age и самые старые сверх
+    max_groups выбрасываются, чтобы брошенные альбомы не копились.
+
+    Альбом никогда не делится на части: вторая часть загрузилась бы под
+    тот же префикс и удалила файлы первой. Сразу, без ожидания,
+    обрабатывается только альбом из TELEGRAM_ALBUM_LIMIT сообщений — больше
+    частей у него не будет.
+    """
+
+    def __init__(self, debounce: float, max_age: float, max_groups: int):
+        self.debounce = debounce
+        self.max_age = max_age
+        self.max_groups = max_groups
+        self._albums: dict[str, Album] = {}
+        # Уже обработанные альбомы: group_id -> time.monotonic() обработки
+        self._done: dict[str, float] = {}
+        # Задачи, которые уже обрабатывают альбом: держим ссылки, чтобы их
+        # не собрал сборщик мусора
+        self._running: set[asyncio.Task] = set()
+
+    def add(self, message: types.Message, callback: AlbumCallback) -> bool:
+        """Добавляет сообщение в альбом. False — альбом уже обработан без
+        этого сообщения (оно пришло позже debounce)."""
+        group_id = message.media_group_id
+        self._forget_done()
+        if group_id in self._done:
+            return False
+        self._evict(new_group=group_id not in self._albums)
+        album = self._albums.get(group_id)
+        if album is None:
+            album = self._albums[group_id] = Album(callback)
+        album.messages.append(message)
+        album.callback = callback
+
+        if album.timer is not None:
+            album.timer.cancel()
+        delay = (0 if len(album.messages) >= TELEGRAM_ALBUM_LIMIT
+                 else self.debounce)
+        album.timer = asyncio.create_task(
+            self._flush_later(group_id, delay),
+            context=contextvars.Context())
+        return True
+
+    async def _flush_later(self, group_id: str, delay: float):
+        await asyncio.sleep(delay)
+        album = self._albums.pop(group_id, None)
+        if album is None:
+            return
+        self._done[group_id] = time.monotonic()
+        messages = sorted(album.messages, key=lambda m: m.message_id)
+        task = asyncio.current_task()
+        self._running.add(task)
+        try:
+            await album.callback(messages)
+        except Exception as e:
+            print(f"Ошибка обработки альбома {group_id}: {e}")
+        finally:
+            self._running.discard(task)
+
+    def _forget_done(self):
+        now = time.monotonic()
+        # dict хранит порядок вставки: обработанные раньше идут первыми
+        for group_id, done_at in list(self._done.items()):
+            if now - done_at <= self.max_age \
+                    and len(self._done) <= self.max_groups:
+                break
+            del self._done[group_id]
+
+    def _evict(self, new_group: bool):
+        now = time.monotonic()
+        stale = [group_id for group_id, album in self._albums.items()
+                 if now - album.created > self.max_age]
+        # dict хранит порядок вставки, первые — самые старые
+        overflow = (len(self._albums) - len(stale) + new_group
+                    - self.max_groups)
+        if overflow > 0:
+            stale += [group_id for group_id in self._albums
+                      if group_id not in stale][:overflow]
+        for group_id in stale:
+            album = self._albums.pop(group_id)
+            if album.timer is not None:
+                album.timer.cancel()
+            print(f"Альбом {group_id} выброшен из кэша "
+                  f"({len(album.messages)} сообщений)")
+
+    def __len__(self) -> int:
+        return len(self._albums)
@@ -1,66 +1,264 @@
 import asyncio
-from sqlalchemy import select
+import time
+from datetime import timedelta
+from sqlalchemy import select, update, delete, or_, func, any_, literal, \
+    Integer
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.engine import Row
 
 from aiogram import Bot
+from config import ALERT_MODE, ALERT_MAX_SLEEP, ALERT_RATE, \
+    ALERT_CHAT_INTERVAL, ALERT_MAX_ATTEMPTS, ALERT_BATCH_SIZE, \
+    ALERT_CLAIM_TIMEOUT, ALERT_DIGEST, ALERT_WORKERS
 from database.connect import async_session
-from sqlalchemy.orm import selectinload
-from database.models import SubmittedTaskOnChange, SubmittedTask, Task
+from database.notify import CHANGES_CHANNEL, listen
+from database.models import SubmittedTaskOnChange, SubmittedTask, Task, \
+    Student, Teacher
+from utils.delivery import Delivery
+from utils.metrics import ALERTS_SENT
+
+# Максимальная длина текста сообщения в Telegram
+MESSAGE_LIMIT = 4096
+# Запас до конца аренды: отправка, начатая раньше, успевает закончиться
+# (таймаут запроса aiogram — 60 с) до того, как строку возьмёт другой воркер
+LEASE_MARGIN = 60
+
 
 async def alerts(bot: Bot, sleep: int = 1):
+    """Рассылает студентам уведомления о проверенных работах.
+
+    В режиме notify просыпаемся по NOTIFY из триггера на
+    submitted_tasks_on_change, а пауза между пустыми опросами растёт от
+    sleep до ALERT_MAX_SLEEP — это страховка на случай потерянных
+    уведомлений. В режиме poll очередь опрашивается раз в sleep секунд.
+
+    Рассылать могут несколько процессов сразу (ALERT_WORKERS), каждый
+    в пределах своей доли лимита ALERT_RATE. Доставка «хотя бы один раз»:
+    если процесс упал или не смог удалить строки после отправки, через
+    ALERT_CLAIM_TIMEOUT секунд уведомление уйдёт ещё раз. Без сбоев
+    каждое изменение отправляется ровно один раз (см. drain_once).
+    """
+    delivery = Delivery(bot, rate=ALERT_RATE / ALERT_WORKERS,
+                        chat_interval=ALERT_CHAT_INTERVAL)
+    wakeup = asyncio.Event()
+    max_sleep = sleep
+    if ALERT_MODE == "notify":
+        # Триггер ставит миграция 006_change_notify_trigger.sql, здесь
+        # только слушаем канал
+        asyncio.create_task(listen(CHANGES_CHANNEL, wakeup.set))
+        max_sleep = max(sleep, ALERT_MAX_SLEEP)
+
+    delay = sleep
     while True:
-        async with async_session() as session:
-            result = await session.execute(
-                select(SubmittedTaskOnChange)
-                .options(
-                    # сразу подтягиваем SubmittedTask и все нужные связи,
-                    # чтобы потом не было ленивой загрузки
-                    selectinload(SubmittedTaskOnChange.submitted_task)
-                    .selectinload(SubmittedTask.task)
-                    .selectinload(Task.teacher),
-                    selectinload(SubmittedTaskOnChange.submitted_task)
-                    .selectinload(SubmittedTask.status),
-                    selectinload(SubmittedTaskOnChange.submitted_task)
-                    .selectinload(SubmittedTask.student),
-                )
-                .order_by(SubmittedTaskOnChange.id)
-                .limit(25)
-            )
-            changes = result.scalars().all()
+        wakeup.clear()
+        try:
+            processed = await drain_once(delivery)
+        except Exception as e:
+            print(f"Ошибка при рассылке уведомлений: {e}")
+            processed = 0
+
+        if processed:
+            # В очереди может быть ещё что-то — разбираем без паузы
+            delay = sleep
+            continue
+
+        try:
+            await asyncio.wait_for(wakeup.wait(), timeout=delay)
+            delay = sleep
+        except asyncio.TimeoutError:
+            delay = min(delay * 2, max_sleep)
+
+
+def claim_changes_query(limit: int):
+    """Один запрос, который атомарно арендует до limit свободных строк
+    очереди и сразу отдаёт всё нужное для текста уведомления.
+
+    FOR UPDATE SKIP LOCKED не даёт двум воркерам взять одну строку, а
+    claimed_until прячет взятые строки от остальных воркеров на
+    ALERT_CLAIM_TIMEOUT секунд. Вместо ORM-графов выбираются только
+    нужные колонки.
+    """
+    # Время берём у базы, чтобы не зависеть от часов разных реплик
+    now = func.now()
+    claimable = (
+        select(SubmittedTaskOnChange.id)
+        .where(or_(SubmittedTaskOnChange.claimed_until.is_(None),
+                   SubmittedTaskOnChange.claimed_until < now))
+        .order_by(SubmittedTaskOnChange.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+        .cte("claimable")
+    )
+    claimed = (
+        update(SubmittedTaskOnChange)
+        .where(SubmittedTaskOnChange.id.in_(select(claimable.c.id)))
+        .values(claimed_until=now + timedelta(seconds=ALERT_CLAIM_TIMEOUT))
+        .returning(SubmittedTaskOnChange.id,
+                   SubmittedTaskOnChange.submitted_task_id,
+                   SubmittedTaskOnChange.attempts)
+        .cte("claimed")
+    )
+    # outer join: строка с битым FK тоже вернётся и будет удалена
+    return (
+        select(
+            claimed.c.id,
+            claimed.c.submitted_task_id,
+            claimed.c.attempts,
+            Student.telegram_id,
+            Task.topic,
+            SubmittedTask.grade,
+            SubmittedTask.comment,
+            Teacher.name.label("teacher_name"),
+            Teacher.telegram_nickname,
+        )
+        .select_from(claimed)
+        .outerjoin(SubmittedTask,
+                   SubmittedTask.id == claimed.c.submitted_task_id)
+        .outerjoin(Task, Task.id == SubmittedTask.task_id)
+        .outerjoin(Teacher, Teacher.id == Task.teacher_id)
+        .outerjoin(Student, Student.id == SubmittedTask.student_id)
+        .order_by(claimed.c.id)
+    )
 
-            if not changes:
-                await asyncio.sleep(sleep)
-                continue
 
-            for change in changes:
-                st = change.submitted_task
-                if st is None:
-                    # на всякий случай, если FK битый
-                    await session.delete(change)
-                    continue
+def ids_param(ids: list[int]):
+    # = ANY(:ids) вместо IN (...) — один и тот же текст запроса при любом
+    # размере пачки
+    return any_(literal(ids, ARRAY(Integer)))
+
+
+async def drain_once(delivery: Delivery) -> int:
+    """Обрабатывает одну пачку изменений и возвращает число строк, ушедших
+    из очереди. Недоставленные из-за временных ошибок строки остаются в
+    очереди и повторяются с нарастающей паузой."""
+    # Аренда истекает по часам базы, а здесь отсчитываем её по своим с
+    # момента до запроса — так конец аренды оценивается с запасом
+    lease_end = time.monotonic() + max(ALERT_CLAIM_TIMEOUT - LEASE_MARGIN,
+                                       ALERT_CLAIM_TIMEOUT / 2)
+    async with async_session() as session:
+        result = await session.execute(claim_changes_query(ALERT_BATCH_SIZE))
+        rows = result.all()
+        # Аренда зафиксирована — рассылаем уже вне транзакции
+        await session.commit()
+    if not rows:
+        return 0
+
+    done = []
+    # Несколько правок одной работы дают одно уведомление: строки запроса
+    # отражают текущее состояние работы, так что все они одинаковы
+    latest: dict[int, Row] = {}
+    change_ids: dict[int, list[int]] = {}
+    # id строки очереди -> сколько раз её уже не удалось доставить
+    attempts = {row.id: row.attempts for row in rows}
+    for row in rows:
+        if row.telegram_id is None:
+            # на всякий случай, если FK битый
+            done.append(row.id)
+            continue
+        latest[row.submitted_task_id] = row
+        change_ids.setdefault(row.submitted_task_id, []).append(row.id)
+
+    # (id строк очереди, chat_id, текст)
+    to_send: list[tuple[list[int], int, str]] = []
+    if ALERT_DIGEST:
+        by_chat: dict[int, list[Row]] = {}
+        for row in latest.values():
+            by_chat.setdefault(row.telegram_id, []).append(row)
+        for chat_id, chat_rows in by_chat.items():
+            for part in digest_parts(chat_rows):
+                ids = [i for row in part
+                       for i in change_ids[row.submitted_task_id]]
+                to_send.append((ids, chat_id, format_digest(part)))
+    else:
+        for submitted_task_id, row in latest.items():
+            to_send.append((change_ids[submitted_task_id], row.telegram_id,
+                            format_alert(row)))
+
+    # После конца аренды строки может взять другой воркер, поэтому новые
+    # отправки не начинаются: иначе одно уведомление ушло бы дважды
+    results = await delivery.send_many(
+        [(chat_id, text) for _, chat_id, text in to_send], deadline=lease_end)
+    for delivered in results:
+        ALERTS_SENT.labels({True: "delivered", None: "undeliverable",
+                            False: "retry"}[delivered]).inc()
+    lease_lost = time.monotonic() >= lease_end
+
+    # id строк по номеру неудачной попытки. Счётчик хранится в самой
+    # строке, так что его видят все воркеры и он переживает перезапуск
+    postponed: dict[int, list[int]] = {}
+    for (ids, _, _), delivered in zip(to_send, results):
+        if delivered is False and lease_lost:
+            # Строки уже вернулись в очередь, не трогаем чужую аренду
+            continue
+        if delivered is not False:
+            done.extend(ids)
+            continue
+        # Строки одного сообщения повторяются вместе, поэтому счётчик у
+        # них общий — по самой невезучей из них
+        failed = max(attempts[i] for i in ids) + 1
+        if retry_delay(failed) is None:
+            print(f"Уведомления {ids} так и не доставлены, удаляем")
+            done.extend(ids)
+        else:
+            postponed.setdefault(failed, []).extend(ids)
+
+    async with async_session() as session:
+        # удаляем записи из очереди одним запросом
+        if done:
+            await session.execute(
+                delete(SubmittedTaskOnChange)
+                .where(SubmittedTaskOnChange.id == ids_param(done))
+            )
+        # откладываем повтор, продлевая аренду, и тем же запросом
+        # записываем число неудачных попыток
+        for failed, ids in postponed.items():
+            delay = retry_delay(failed)
+            await session.execute(
+                update(SubmittedTaskOnChange)
+                .where(SubmittedTaskOnChange.id == ids_param(ids))
+                .values(claimed_until=func.now() + timedelta(seconds=delay),
+                        attempts=failed)
+            )
+        await session.commit()
+    return len(done)
+
 
-                task = st.task
-                student = st.student
-                teacher = task.teacher
+def format_alert(row: Row) -> str:
+    return (
+        f"❗️ Ваше задание по теме «{row.topic}» проверено.\n"
+        f"📊 Оценка: {row.grade}\n"
+        f"💬 Коммент: {row.comment}\n"
+        f"👤 Преподаватель: {row.teacher_name} {row.telegram_nickname}\n"
+    )
 
-                text = (
-                    f"❗️ Ваше задание по теме «{task.topic}» проверено.\n"
-                    f"📊 Оценка: {st.grade}\n"
-                    f"💬 Коммент: {st.comment}\n"
-                    f"👤 Преподаватель: {teacher.name} {teacher.telegram_nickname}\n"
-                )
 
-                try:
-                    await bot.send_message(
-                        chat_id=student.telegram_id,
-                        text=text,
-                    )
-                except Exception as e:
-                    print(f"Не смог отправить сообщение {student.telegram_id}: {e}")
+def format_digest(rows: list[Row]) -> str:
+    if len(rows) == 1:
+        return format_alert(rows[0])
+    items = [
+        f"📚 «{row.topic}»\n"
+        f"📊 Оценка: {row.grade}\n"
+        f"💬 Коммент: {row.comment}\n"
+        f"👤 Преподаватель: {row.teacher_name} {row.telegram_nickname}\n"
+        for row in rows
+    ]
+    return "❗️ Проверены ваши задания:\n\n" + "\n".join(items)
 
-                # удаляем запись из очереди
-                await session.delete(change)
 
-            await session.commit()
+def digest_parts(rows: list[Row]) -> list[list[Row]]:
+    """Делит работы на части, дайджест каждой из которых влезает в одно
+    сообщение Telegram."""
+    parts = [[]]
+    for row in rows:
+        if parts[-1] and len(format_digest(parts[-1] + [row])) > MESSAGE_LIMIT:
+            parts.append([])
+        parts[-1].append(row)
+    return parts
 
-        await asyncio.sleep(sleep)
 
+def retry_delay(attempts: int) -> int | None:
+    """Пауза до повтора после attempts неудачных попыток. None — попытки
+    кончились."""
+    if attempts >= ALERT_MAX_ATTEMPTS:
+        return None
+    return 2 ** attempts
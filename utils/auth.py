@@ -1,10 +1,16 @@
-from database.request import get_student_by_telegram_id, \
-    get_student_id_by_telegram_id
 from aiogram import BaseMiddleware
 from aiogram.types import Message
 from aiogram.fsm.context import FSMContext
 from typing import Callable, Dict, Any, Awaitable
 
+from states.data import UserData
+from utils.identity import IDENTITIES
+
+# Сообщения, после которых данные студента перечитываются из базы: так
+# только что добавленный или переведённый на другой курс студент не ждёт,
+# пока истечёт IDENTITY_TTL
+REFRESH_IDENTITY = {"/start", "📚 Выбрать курс"}
+
 
 class AuthMiddleware(BaseMiddleware):
     async def __call__(
@@ -16,38 +22,30 @@ class AuthMiddleware(BaseMiddleware):
         state: FSMContext = data["state"]
         message: Message = event
 
-        if not await get_or_load_user_from_db(state, message):
+        if message.text in REFRESH_IDENTITY:
+            IDENTITIES.invalidate(message.from_user.id)
+        # Один индексированный запрос, дальше — из кэша
+        identity = await IDENTITIES.resolve(message.from_user.id)
+        if identity is None:
             await message.answer(
-                "У вас нет доступа к боту. Обратитесь к преподавателю.")
+                "У вас нет доступа к боту. Обратитесь к преподавателю, "
+                "а после добавления отправьте /start.")
             return
-        student_id = await get_student_id_by_telegram_id(message.from_user.id)
-        await state.update_data(student_id=student_id)
-        return await handler(event, data)
-
 
-async def get_or_load_user_from_db(state: FSMContext, message: Message) -> bool:
-    data = await state.get_data()
-
-    # Если данные уже есть — ничего не делаем
-    if data.get("fio") and data.get("group") and data.get(
-            "user_id") == message.from_user.id:
-        return True
-
-    # Пытаемся найти пользователя в базе
-    student = await get_student_by_telegram_id(message.from_user.id)
-    if not student:
-        return False  # доступа нет
-
-    await state.update_data(
-        fio=student.name,
-        user_id=message.from_user.id
-    )
-    return True
+        user_data = await UserData.load(state)
+        if (user_data.student_id != identity.student_id
+                or user_data.fio != identity.name
+                or user_data.user_id != message.from_user.id):
+            await UserData.update(
+                state,
+                student_id=identity.student_id,
+                fio=identity.name,
+                user_id=message.from_user.id,
+            )
+        data["identity"] = identity
+        return await handler(event, data)
 
 
 async def get_mask_for_save(state: FSMContext) -> str:
-    data = await state.get_data()
-    course_id = data["course_id"]
-    task_id = data["task_id"]
-    user_id = data["user_id"]
-    return f"{course_id}/{task_id}/{user_id}/"
+    data = await UserData.load(state)
+    return f"{data.course_id}/{data.task_id}/{data.user_id}/"
@@ -0,0 +1,170 @@
+import asyncio
+import time
+from dataclasses import dataclass
+from datetime import date
+
+from aiogram.types import ReplyKeyboardMarkup
+
+from config import CATALOG_CHECK_INTERVAL, CATALOG_FULL_REFRESH
+from database.request import get_catalog_version, get_catalog_rows
+from keyboards.reply import topics_keyboard
+
+
+@dataclass(frozen=True, slots=True)
+class CourseInfo:
+    id: int
+    name: str
+    is_deleted: bool
+
+
+@dataclass(frozen=True, slots=True)
+class TeacherInfo:
+    id: int
+    name: str
+    telegram_nickname: str
+
+
+@dataclass(frozen=True, slots=True)
+class TaskInfo:
+    id: int
+    topic: str
+    task_link: str
+    deadline: date
+    teacher: TeacherInfo
+    type: int
+    course_id: int
+    need_code: bool
+
+
+class Catalog:
+    """Курсы, задания и преподаватели в памяти процесса.
+
+    Справочник меняется редко, поэтому навигация по темам обходится без
+    базы. Не чаще раза в check_interval секунд сверяем дешёвую версию
+    (количество и максимальный id по каждой таблице): если добавились
+    только новые строки — дочитываем их, иначе перечитываем всё. Правки
+    существующих строк версия не ловит, поэтому раз в full_refresh секунд
+    справочник перечитывается целиком.
+    """
+
+    def __init__(self, check_interval: float, full_refresh: float):
+        self.check_interval = check_interval
+        self.full_refresh = full_refresh
+        self._version: tuple[int, ...] | None = None
+        self._checked_at = 0.0
+        self._loaded_at = 0.0
+        self._lock = asyncio.Lock()
+        self._courses: dict[int, CourseInfo] = {}
+        self._teachers: dict[int, TeacherInfo] = {}
+        self._tasks: dict[int, TaskInfo] = {}
+        self._topics: dict[int, list[TaskInfo]] = {}
+        self._keyboards: dict[int, ReplyKeyboardMarkup] = {}
+
+    async def courses(self, course_ids) -> list[CourseInfo]:
+        """Неудалённые курсы из переданных id."""
+        await self.refresh()
+        return [self._courses[course_id] for course_id in course_ids
+                if course_id in self._courses
+                and not self._courses[course_id].is_deleted]
+
+    async def find_course(self, course_ids, name: str) -> CourseInfo | None:
+        for course in await self.courses(course_ids):
+            if course.name == name:
+                return course
+        return None
+
+    async def find_task(self, course_id: int, topic: str) -> TaskInfo | None:
+        for task in await self.topics(course_id):
+            if task.topic == topic:
+                return task
+        return None
+
+    async def topics(self, course_id: int) -> list[TaskInfo]:
+        await self.refresh()
+        return self._topics.get(course_id, [])
+
+    async def topics_keyboard(self,
+                              course_id: int) -> ReplyKeyboardMarkup | None:
+        await self.refresh()
+        return self._keyboards.get(course_id)
+
+    async def task(self, task_id: int) -> TaskInfo | None:
+        await self.refresh()
+        if task_id not in self._tasks:
+            # Задание могли добавить только что — сверяемся с базой сразу
+            await self.refresh(force=True)
+        return self._tasks.get(task_id)
+
+    async def refresh(self, force: bool = False):
+        if not force and time.monotonic() - self._checked_at < self.check_interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            if not force and now - self._checked_at < self.check_interval:
+                return
+            version = await get_catalog_version()
+            if self._version is None or now - self._loaded_at >= self.full_refresh:
+                await self._load_all(version)
+            elif version != self._version:
+                await self._load_new(version)
+            self._checked_at = time.monotonic()
+
+    async def _load_all(self, version: tuple[int, ...]):
+        courses, tasks, teachers = await get_catalog_rows()
+        self._courses = {}
+        self._teachers = {}
+        self._tasks = {}
+        self._apply(courses, tasks, teachers)
+        self._version = version
+        self._loaded_at = time.monotonic()
+
+    async def _load_new(self, version: tuple[int, ...]):
+        old = self._version
+        courses, tasks, teachers = await get_catalog_rows(
+            min_course_id=old[1], min_task_id=old[3], min_teacher_id=old[5])
+        # Версия сходится, только если строки лишь добавлялись
+        expected = (
+            old[0] + len(courses), version[1],
+            old[2] + len(tasks), version[3],
+            old[4] + len(teachers), version[5],
+        )
+        if expected != version:
+            await self._load_all(version)
+            return
+        self._apply(courses, tasks, teachers)
+        self._version = version
+
+    def _apply(self, courses, tasks, teachers):
+        for course in courses:
+            self._courses[course.id] = CourseInfo(
+                id=course.id, name=course.name, is_deleted=course.is_deleted)
+        for teacher in teachers:
+            self._teachers[teacher.id] = TeacherInfo(
+                id=teacher.id, name=teacher.name,
+                telegram_nickname=teacher.telegram_nickname)
+        for task in tasks:
+            self._tasks[task.id] = TaskInfo(
+                id=task.id,
+                topic=task.topic,
+                task_link=task.task_link,
+                deadline=task.deadline,
+                teacher=self._teachers[task.teacher_id],
+                type=task.type,
+                course_id=task.course_id,
+                need_code=task.need_code,
+            )
+        self._rebuild_topics()
+
+    def _rebuild_topics(self):
+        topics: dict[int, list[TaskInfo]] = {}
+        for task in sorted(self._tasks.values(), key=lambda t: t.id):
+            topics.setdefault(task.course_id, []).append(task)
+        self._topics = topics
+        self._keyboards = {
+            course_id: topics_keyboard([task.topic for task in course_tasks])
+            for course_id, course_tasks in topics.items()
+        }
+
+
+CATALOG = Catalog(check_interval=CATALOG_CHECK_INTERVAL,
+                  full_refresh=CATALOG_FULL_REFRESH)
@@ -0,0 +1,38 @@
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+from typing import Callable, Dict, Any, Awaitable
+
+from database.connect import update_session_factory, current_session, \
+    update_read_session_factory, current_read_session, has_replica
+
+
+class DbSessionMiddleware(BaseMiddleware):
+    """Один объект AsyncSession на всё обновление (и ещё один для
+    реплики, если она настроена) вместо нового на каждый запрос.
+
+    Функции database.request получают эти сессии через get_session() и
+    get_read_session(). Соединение при этом не держится на всё
+    обновление: каждый вызов берёт его из пула и завершает свою
+    транзакцию сразу после запроса, так что пока хендлер ждёт Telegram
+    или S3, соединение свободно.
+    """
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: Dict[str, Any]
+    ) -> Any:
+        async with update_session_factory() as session:
+            token = current_session.set(session)
+            try:
+                if not has_replica():
+                    return await handler(event, data)
+                async with update_read_session_factory() as read:
+                    read_token = current_read_session.set(read)
+                    try:
+                        return await handler(event, data)
+                    finally:
+                        current_read_session.reset(read_token)
+            finally:
+                current_session.reset(token)
@@ -0,0 +1,106 @@
+import asyncio
+import time
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter, TelegramForbiddenError, \
+    TelegramBadRequest
+
+
+class TokenBucket:
+    """Ограничитель частоты: не больше rate операций в секунду с запасом
+    на всплеск в capacity операций."""
+
+    def __init__(self, rate: float, capacity: float | None = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self.tokens = min(self.capacity,
+                                  self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        """Останавливает выдачу на seconds секунд (ответ RetryAfter)."""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+
+class Delivery:
+    """Рассылка сообщений в пределах лимитов Telegram.
+
+    Сообщения уходят параллельно, но не чаще rate в секунду суммарно и не
+    чаще раза в chat_interval секунд в один чат. На RetryAfter вся рассылка
+    замирает на указанное Telegram время, после чего сообщение повторяется.
+    """
+
+    def __init__(self, bot: Bot, rate: float, chat_interval: float,
+                 retries: int = 3):
+        self.bot = bot
+        self.bucket = TokenBucket(rate)
+        self.chat_interval = chat_interval
+        self.retries = retries
+        self._chat_locks: dict[int, asyncio.Lock] = {}
+        self._chat_next: dict[int, float] = {}
+
+    async def send(self, chat_id: int, text: str,
+                   deadline: float | None = None) -> bool | None:
+        """True — доставлено, None — доставить невозможно (бот
+        заблокирован, чат не найден), False — стоит повторить позже.
+
+        После deadline (по time.monotonic) новые попытки не начинаются и
+        возвращается False.
+        """
+        lock = self._chat_locks.setdefault(chat_id, asyncio.Lock())
+        async with lock:
+            for _ in range(self.retries):
+                wait = self._chat_next.get(chat_id, 0) - time.monotonic()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                await self.bucket.acquire()
+                if deadline is not None and time.monotonic() >= deadline:
+                    return False
+                try:
+                    await self.bot.send_message(chat_id=chat_id, text=text)
+                    return True
+                except TelegramRetryAfter as e:
+                    self.bucket.pause(e.retry_after)
+                except (TelegramForbiddenError, TelegramBadRequest) as e:
+                    print(f"Не смог отправить сообщение {chat_id}: {e}")
+                    return None
+                except Exception as e:
+                    print(f"Не смог отправить сообщение {chat_id}: {e}")
+                    return False
+                finally:
+                    self._chat_next[chat_id] = \
+                        time.monotonic() + self.chat_interval
+            return False
+
+    async def send_many(self, messages: list[tuple[int, str]],
+                        deadline: float | None = None) -> list:
+        """Отправляет пары (chat_id, text), результаты — как у send()."""
+        results = await asyncio.gather(*(
+            self.send(chat_id, text, deadline) for chat_id, text in messages))
+        self._forget_idle_chats()
+        return list(results)
+
+    def _forget_idle_chats(self):
+        now = time.monotonic()
+        for chat_id in [c for c, t in self._chat_next.items() if t < now]:
+            lock = self._chat_locks.get(chat_id)
+            if lock is None or not lock.locked():
+                self._chat_next.pop(chat_id, None)
+                self._chat_locks.pop(chat_id, None)
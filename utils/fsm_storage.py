@@ -0,0 +1,119 @@
+import asyncio
+import json
+from datetime import datetime, timedelta, timezone
+from functools import partial
+from typing import Any, Dict, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StorageKey, StateType, \
+    DefaultKeyBuilder
+from aiogram.fsm.storage.memory import MemoryStorage
+from sqlalchemy import select, delete, case
+from sqlalchemy.dialects.postgresql import insert
+
+from config import FSM_STORAGE, REDIS_URL, FSM_STATE_TTL
+from database.connect import async_session
+from database.models import FsmRecord
+
+# Компактный JSON: без пробелов и \u-экранирования кириллицы
+json_dumps = partial(json.dumps, separators=(",", ":"), ensure_ascii=False)
+
+
+class PostgresStorage(BaseStorage):
+    """FSM-хранилище в таблице fsm_states через общий engine бота.
+
+    Состояние и данные лежат в одной строке на пользователя. Записи, которые
+    не менялись дольше ttl секунд, считаются пустыми и периодически
+    удаляются.
+    """
+
+    def __init__(self, ttl: int, cleanup_interval: int = 3600):
+        self.ttl = timedelta(seconds=ttl)
+        self.key_builder = DefaultKeyBuilder()
+        self._cleanup = asyncio.create_task(self._cleanup_loop(cleanup_interval))
+
+    async def _get(self, key: StorageKey) -> FsmRecord | None:
+        async with async_session() as session:
+            result = await session.execute(
+                select(FsmRecord)
+                .where(FsmRecord.key == self.key_builder.build(key))
+                .where(FsmRecord.updated_at > self._expired_before())
+            )
+            return result.scalar_one_or_none()
+
+    async def _upsert(self, key: StorageKey, **values):
+        values["updated_at"] = datetime.now(timezone.utc)
+        stmt = insert(FsmRecord).values(key=self.key_builder.build(key),
+                                        **values)
+        # Просроченная строка, которую ещё не удалил cleanup, считается
+        # пустой: вторую колонку сбрасываем, иначе вместе со свежими данными
+        # вернулось бы давно забытое состояние. В ON CONFLICT справа от =
+        # колонки берутся из старой строки
+        expired = FsmRecord.updated_at <= self._expired_before()
+        set_ = dict(values)
+        for column in ("state", "data"):
+            if column not in values:
+                set_[column] = case((expired, None),
+                                    else_=getattr(FsmRecord, column))
+        stmt = stmt.on_conflict_do_update(index_elements=[FsmRecord.key],
+                                          set_=set_)
+        async with async_session() as session:
+            await session.execute(stmt)
+            await session.commit()
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        await self._upsert(
+            key, state=state.state if isinstance(state, State) else state)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        record = await self._get(key)
+        return record.state if record else None
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        await self._upsert(key, data=json_dumps(data) if data else None)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        record = await self._get(key)
+        if record is None or not record.data:
+            return {}
+        return json.loads(record.data)
+
+    async def cleanup(self):
+        async with async_session() as session:
+            await session.execute(
+                delete(FsmRecord)
+                .where(FsmRecord.updated_at <= self._expired_before())
+            )
+            await session.commit()
+
+    async def _cleanup_loop(self, interval: int):
+        while True:
+            try:
+                await self.cleanup()
+            except Exception as e:
+                print(f"Не удалось очистить старые FSM-состояния: {e}")
+            await asyncio.sleep(interval)
+
+    def _expired_before(self) -> datetime:
+        return datetime.now(timezone.utc) - self.ttl
+
+    async def close(self) -> None:
+        self._cleanup.cancel()
+
+
+def create_storage() -> BaseStorage:
+    """FSM-хранилище, выбранное в config.FSM_STORAGE."""
+    if FSM_STORAGE == "memory":
+        return MemoryStorage()
+    if FSM_STORAGE == "redis":
+        # redis нужен только для этого режима
+        from aiogram.fsm.storage.redis import RedisStorage
+        return RedisStorage.from_url(
+            REDIS_URL,
+            state_ttl=FSM_STATE_TTL,
+            data_ttl=FSM_STATE_TTL,
+            json_dumps=json_dumps,
+        )
+    if FSM_STORAGE == "postgres":
+        return PostgresStorage(ttl=FSM_STATE_TTL)
+    raise ValueError(f"Неизвестное FSM_STORAGE: {FSM_STORAGE}")
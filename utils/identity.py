@@ -0,0 +1,69 @@
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from config import IDENTITY_TTL, IDENTITY_NEGATIVE_TTL, IDENTITY_CACHE_SIZE
+from database.request import get_student_rows_by_telegram_id
+
+
+@dataclass(frozen=True, slots=True)
+class StudentIdentity:
+    student_id: int
+    name: str
+    course_ids: tuple[int, ...]
+
+
+class IdentityCache:
+    """LRU-кэш студентов по telegram_id с TTL.
+
+    Отказы в доступе тоже кэшируются, но на более короткий срок, чтобы
+    добавленный преподавателем студент быстро получил доступ. Записей не
+    больше max_size: сверх этого вытесняются давно не использованные.
+    """
+
+    def __init__(self, ttl: float, negative_ttl: float, max_size: int):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_size = max_size
+        self._items: OrderedDict[
+            int, tuple[float, StudentIdentity | None]] = OrderedDict()
+
+    async def resolve(self, telegram_id: int) -> StudentIdentity | None:
+        now = time.monotonic()
+        item = self._items.get(telegram_id)
+        if item is not None and item[0] > now:
+            self._items.move_to_end(telegram_id)
+            return item[1]
+
+        rows = await get_student_rows_by_telegram_id(telegram_id)
+        if not rows:
+            identity = None
+            expires_at = now + self.negative_ttl
+        else:
+            student_id, name, _ = rows[0]
+            identity = StudentIdentity(
+                student_id=student_id,
+                name=name,
+                course_ids=tuple(dict.fromkeys(row[2] for row in rows)),
+            )
+            expires_at = now + self.ttl
+        self._items[telegram_id] = (expires_at, identity)
+        self._items.move_to_end(telegram_id)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+        return identity
+
+    def invalidate(self, telegram_id: int | None = None):
+        """Сбрасывает запись студента, а без аргумента — весь кэш."""
+        if telegram_id is None:
+            self._items.clear()
+        else:
+            self._items.pop(telegram_id, None)
+
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+IDENTITIES = IdentityCache(ttl=IDENTITY_TTL, negative_ttl=IDENTITY_NEGATIVE_TTL,
+                           max_size=IDENTITY_CACHE_SIZE)
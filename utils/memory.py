@@ -0,0 +1,59 @@
+import asyncio
+import sys
+
+from aiogram.fsm.storage.base import BaseStorage
+from aiogram.fsm.storage.memory import MemoryStorage
+
+
+def deep_sizeof(obj, seen: set[int] | None = None) -> int:
+    """Размер объекта в байтах вместе со всем, на что он ссылается."""
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(k, seen) + deep_sizeof(v, seen)
+                    for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(item, seen) for item in obj)
+    else:
+        if hasattr(obj, "__dict__"):
+            size += deep_sizeof(vars(obj), seen)
+        for slot in getattr(type(obj), "__slots__", ()):
+            if hasattr(obj, slot):
+                size += deep_sizeof(getattr(obj, slot), seen)
+    return size
+
+
+def fsm_memory_report(storage: BaseStorage) -> dict | None:
+    """Сколько памяти занимают FSM-данные пользователей.
+
+    Считается только для MemoryStorage — у внешних хранилищ данные лежат
+    вне процесса.
+    """
+    if not isinstance(storage, MemoryStorage):
+        return None
+
+    sizes = [
+        deep_sizeof(record.data) + deep_sizeof(record.state)
+        for record in list(storage.storage.values())
+        if record.data or record.state
+    ]
+    total = sum(sizes)
+    return {
+        "users": len(sizes),
+        "total_bytes": total,
+        "bytes_per_user": total // len(sizes) if sizes else 0,
+        "max_bytes": max(sizes, default=0),
+    }
+
+
+async def report_fsm_memory(storage: BaseStorage, interval: int):
+    while True:
+        await asyncio.sleep(interval)
+        report = fsm_memory_report(storage)
+        if report is not None:
+            print(f"FSM memory: {report}")
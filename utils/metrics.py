@@ -0,0 +1,151 @@
+import asyncio
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Any, Awaitable
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+from sqlalchemy import event
+
+from database.pool import pool_stats
+from database.request import get_alert_backlog
+from utils.tracing import span
+from yandexAPI.cache import OBJECT_CACHE
+
+# Бакеты в секундах: от быстрых запросов к базе до загрузки больших PDF
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+HANDLER_LATENCY = Histogram(
+    "bot_handler_seconds", "Время работы хендлера",
+    ["router", "handler", "state"], buckets=BUCKETS)
+HANDLER_ERRORS = Counter(
+    "bot_handler_errors_total", "Исключения в хендлерах",
+    ["router", "handler", "state"])
+STEP_LATENCY = Histogram(
+    "bot_step_seconds", "Время отдельных шагов отправки и показа работы",
+    ["step"], buckets=BUCKETS)
+SQL_LATENCY = Histogram(
+    "bot_sql_seconds", "Время выполнения SQL-запросов",
+    ["engine", "operation"], buckets=BUCKETS)
+SQL_ERRORS = Counter(
+    "bot_sql_errors_total", "Ошибки SQL-запросов", ["engine"])
+S3_LATENCY = Histogram(
+    "bot_s3_seconds", "Время запросов к S3", ["operation"], buckets=BUCKETS)
+S3_ERRORS = Counter(
+    "bot_s3_errors_total", "Ошибки запросов к S3", ["operation"])
+S3_BYTES = Counter(
+    "bot_s3_bytes_total", "Байты, переданные в S3 и полученные из него",
+    ["direction"])
+ALERT_BACKLOG = Gauge(
+    "bot_alert_backlog", "Строк в очереди submitted_tasks_on_change")
+ALERT_CLAIMED = Gauge(
+    "bot_alert_claimed", "Строк очереди, которые сейчас в аренде")
+DB_POOL_CHECKED_OUT = Gauge(
+    "bot_db_pool_checked_out", "Занятые соединения пула", ["engine"])
+DB_POOL_WAITS = Gauge(
+    "bot_db_pool_waits", "Сколько раз ждали свободное соединение", ["engine"])
+DB_POOL_WAIT_SECONDS = Gauge(
+    "bot_db_pool_wait_seconds", "Суммарное ожидание соединения", ["engine"])
+DB_POOL_TIMEOUTS = Gauge(
+    "bot_db_pool_timeouts", "Сколько раз не дождались соединения",
+    ["engine"])
+OBJECT_CACHE_BYTES = Gauge(
+    "bot_object_cache_bytes", "Размер кэша объектов S3")
+OBJECT_CACHE_HITS = Gauge(
+    "bot_object_cache_hits", "Попадания в кэш объектов S3")
+OBJECT_CACHE_MISSES = Gauge(
+    "bot_object_cache_misses", "Промахи кэша объектов S3")
+ALERTS_SENT = Counter(
+    "bot_alerts_total", "Результаты доставки уведомлений", ["result"])
+
+
+@contextmanager
+def step(name: str):
+    """Замер шага: with step("upload"): ... Шаг попадает и в метрики, и в
+    трассу обновления."""
+    with STEP_LATENCY.labels(name).time(), span(f"step {name}"):
+        yield
+
+
+class MetricsMiddleware(BaseMiddleware):
+    """Время хендлеров по роутеру, хендлеру и FSM-состоянию.
+
+    Регистрируется как внутренний middleware, поэтому к этому моменту уже
+    известен хендлер, который будет вызван.
+    """
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: Dict[str, Any]
+    ) -> Any:
+        callback = data["handler"].callback
+        labels = (callback.__module__.rsplit(".", 1)[-1],
+                  callback.__name__,
+                  data.get("raw_state") or "none")
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            HANDLER_ERRORS.labels(*labels).inc()
+            raise
+        finally:
+            HANDLER_LATENCY.labels(*labels).observe(
+                time.perf_counter() - started)
+
+
+def instrument_engine(engine, name: str):
+    """Замеряет время каждого SQL-запроса через события engine."""
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_started"].pop()
+        operation = statement.lstrip().split(None, 1)[0].upper()
+        SQL_LATENCY.labels(name, operation).observe(
+            time.perf_counter() - started)
+
+    @event.listens_for(sync_engine, "handle_error")
+    def error(context):
+        conn = context.connection
+        if conn is not None and conn.info.get("query_started"):
+            conn.info["query_started"].pop()
+        SQL_ERRORS.labels(name).inc()
+
+
+async def collect_gauges(engines: dict, interval: int):
+    """Периодически обновляет метрики, которые нужно опрашивать: очередь
+    уведомлений, пулы соединений и кэш объектов."""
+    while True:
+        try:
+            total, claimed = await get_alert_backlog()
+            ALERT_BACKLOG.set(total)
+            ALERT_CLAIMED.set(claimed)
+        except Exception as e:
+            print(f"Не удалось получить размер очереди уведомлений: {e}")
+
+        for name, engine in engines.items():
+            stats = pool_stats(engine)
+            if "checkouts" not in stats:
+                continue
+            DB_POOL_CHECKED_OUT.labels(name).set(stats["checked_out"])
+            DB_POOL_WAITS.labels(name).set(stats["waits"])
+            DB_POOL_WAIT_SECONDS.labels(name).set(stats["wait_total"])
+            DB_POOL_TIMEOUTS.labels(name).set(stats["timeouts"])
+
+        cache = OBJECT_CACHE.stats()
+        OBJECT_CACHE_BYTES.set(cache["bytes"])
+        OBJECT_CACHE_HITS.set(cache["hits"])
+        OBJECT_CACHE_MISSES.set(cache["misses"])
+        await asyncio.sleep(interval)
+
+
+def start_metrics_server(host: str, port: int):
+    """Отдаёт метрики в формате Prometheus на http://host:port/metrics."""
+    start_http_server(port, addr=host)
@@ -0,0 +1,210 @@
+import itertools
+import json
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Any, Awaitable
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.types import TelegramObject
+from sqlalchemy import event
+
+from config import TRACE_SAMPLE_RATE, TRACE_SLOW_SECONDS, TRACE_FILE
+
+
+class Span:
+    """Участок работы с длительностью и вложенными участками."""
+
+    __slots__ = ("name", "attrs", "started", "wall_started", "finished",
+                 "children")
+
+    def __init__(self, name: str, attrs: dict):
+        self.name = name
+        self.attrs = attrs
+        self.started = time.perf_counter()
+        self.wall_started = time.time()
+        self.finished: float | None = None
+        self.children: list[Span] = []
+
+    def child(self, name: str, **attrs) -> "Span":
+        span = Span(name, attrs)
+        self.children.append(span)
+        return span
+
+    def finish(self):
+        self.finished = time.perf_counter()
+
+    @property
+    def duration(self) -> float:
+        end = self.finished if self.finished is not None \
+            else time.perf_counter()
+        return end - self.started
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "start": self.wall_started,
+            "duration_ms": round(self.duration * 1000, 3),
+            "attrs": self.attrs,
+            "children": [child.to_dict() for child in self.children],
+        }
+
+    def format(self, indent: int = 0) -> list[str]:
+        attrs = " ".join(f"{k}={v}" for k, v in self.attrs.items())
+        lines = [f"{'  ' * indent}{self.name} "
+                 f"{self.duration * 1000:.1f} ms {attrs}".rstrip()]
+        for child in self.children:
+            lines.extend(child.format(indent + 1))
+        return lines
+
+
+current_span: ContextVar[Span | None] = ContextVar(
+    "current_span", default=None)
+trace_ids = itertools.count(1)
+
+
+def enabled() -> bool:
+    return TRACE_SAMPLE_RATE > 0 or TRACE_SLOW_SECONDS > 0
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """Дочерний участок текущего. Вне трассировки ничего не делает."""
+    parent = current_span.get()
+    if parent is None:
+        yield None
+        return
+    child = parent.child(name, **attrs)
+    token = current_span.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.attrs["error"] = type(e).__name__
+        raise
+    finally:
+        child.finish()
+        current_span.reset(token)
+
+
+class FileExporter:
+    """Пишет трассы в JSONL-файл, по одной на строку.
+
+    Строка в пару килобайт пишется в локальный файл синхронно — это
+    дешевле, чем гонять её через пул потоков.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+
+    def export(self, trace_id: int, root: Span):
+        if self._file is None:
+            self._file = open(self.path, "a", encoding="utf-8")
+        record = {"trace_id": trace_id, **root.to_dict()}
+        self._file.write(json.dumps(record, ensure_ascii=False,
+                                    default=str) + "\n")
+        self._file.flush()
+
+
+EXPORTER = FileExporter(TRACE_FILE)
+
+
+def finish_trace(trace_id: int, root: Span):
+    """Сохраняет выбранные трассы и печатает дерево медленных."""
+    root.finish()
+    slow = TRACE_SLOW_SECONDS > 0 and root.duration >= TRACE_SLOW_SECONDS
+    if slow:
+        print(f"Медленное обновление (trace {trace_id}):\n"
+              + "\n".join(root.format()))
+    if slow or random.random() < TRACE_SAMPLE_RATE:
+        try:
+            EXPORTER.export(trace_id, root)
+        except Exception as e:
+            print(f"Не удалось записать трассу {trace_id}: {e}")
+
+
+class TracingMiddleware(BaseMiddleware):
+    """Корневой участок на каждое обновление.
+
+    Регистрируется первым внешним middleware, чтобы в трассу попадали и
+    остальные middleware. Участки собираются для каждого обновления, а
+    сохраняются только попавшие в выборку TRACE_SAMPLE_RATE и медленные.
+    """
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: Dict[str, Any]
+    ) -> Any:
+        user = data.get("event_from_user")
+        root = Span("update", {
+            "update_id": getattr(event, "update_id", None),
+            "type": getattr(event, "event_type", None),
+            "user_id": user.id if user else None,
+        })
+        token = current_span.set(root)
+        try:
+            return await handler(event, data)
+        except BaseException as e:
+            root.attrs["error"] = type(e).__name__
+            raise
+        finally:
+            current_span.reset(token)
+            finish_trace(next(trace_ids), root)
+
+
+class HandlerSpanMiddleware(BaseMiddleware):
+    """Участок хендлера с его именем и FSM-состоянием."""
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: Dict[str, Any]
+    ) -> Any:
+        callback = data["handler"].callback
+        with span(f"handler {callback.__module__}.{callback.__name__}",
+                  state=data.get("raw_state")):
+            return await handler(event, data)
+
+
+class TracingRequestMiddleware(BaseRequestMiddleware):
+    """Участок на каждый запрос бота к Telegram Bot API."""
+
+    async def __call__(self, make_request, bot, method):
+        with span(f"telegram {method.__api_method__}"):
+            return await make_request(bot, method)
+
+
+def trace_engine(engine, name: str):
+    """Участок на каждый SQL-запрос через события engine."""
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before(conn, cursor, statement, parameters, context, executemany):
+        parent = current_span.get()
+        child = None
+        if parent is not None:
+            # В дереве запрос в одну строку и без длинного списка колонок
+            child = parent.child(f"sql {name}",
+                                 statement=" ".join(statement.split())[:200])
+        conn.info.setdefault("trace_spans", []).append(child)
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after(conn, cursor, statement, parameters, context, executemany):
+        child = conn.info["trace_spans"].pop()
+        if child is not None:
+            child.finish()
+
+    @event.listens_for(sync_engine, "handle_error")
+    def error(context):
+        conn = context.connection
+        if conn is None or not conn.info.get("trace_spans"):
+            return
+        child = conn.info["trace_spans"].pop()
+        if child is not None:
+            child.attrs["error"] = type(context.original_exception).__name__
+            child.finish()
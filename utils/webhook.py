@@ -0,0 +1,117 @@
+import asyncio
+import hmac
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from aiohttp import web
+
+from config import WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_SECRET, WEBHOOK_HOST, \
+    WEBHOOK_PORT, WEBHOOK_QUEUE_SIZE, WEBHOOK_WORKERS
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WebhookServer:
+    """Приём обновлений от Telegram по webhook.
+
+    Запрос только проверяется и кладётся в ограниченную очередь, а
+    обрабатывают её workers воркеров. Telegram сразу получает ответ и может
+    слать следующие обновления, не дожидаясь хендлеров. Если очередь
+    заполнена, отвечаем 503 — Telegram повторит доставку позже.
+    """
+
+    def __init__(self, dp: Dispatcher, bot: Bot, secret: str | None,
+                 queue_size: int, workers: int):
+        self.dp = dp
+        self.bot = bot
+        self.secret = secret
+        self.queue: asyncio.Queue[Update] = asyncio.Queue(maxsize=queue_size)
+        self.workers = workers
+        self._tasks: list[asyncio.Task] = []
+
+    def create_app(self, path: str) -> web.Application:
+        app = web.Application()
+        app.router.add_post(path, self.handle_update)
+        app.router.add_get("/health", self.health)
+        app.on_startup.append(self._start_workers)
+        app.on_shutdown.append(self._stop_workers)
+        return app
+
+    async def handle_update(self, request: web.Request) -> web.Response:
+        if self.secret and not hmac.compare_digest(
+                request.headers.get(SECRET_HEADER, ""), self.secret):
+            return web.Response(status=401)
+        try:
+            update = Update.model_validate(await request.json(),
+                                           context={"bot": self.bot})
+        except Exception as e:
+            print(f"Некорректное обновление от Telegram: {e}")
+            return web.Response(status=400)
+        try:
+            self.queue.put_nowait(update)
+        except asyncio.QueueFull:
+            return web.Response(status=503)
+        return web.Response()
+
+    async def health(self, request: web.Request) -> web.Response:
+        return web.json_response({
+            "status": "ok",
+            "queue": self.queue.qsize(),
+            "queue_max": self.queue.maxsize,
+            "workers": sum(not task.done() for task in self._tasks),
+        })
+
+    async def _worker(self):
+        while True:
+            update = await self.queue.get()
+            try:
+                await self.dp.feed_update(self.bot, update)
+            except Exception as e:
+                print(f"Ошибка обработки обновления {update.update_id}: {e}")
+            finally:
+                self.queue.task_done()
+
+    async def _start_workers(self, app: web.Application):
+        self._tasks = [asyncio.create_task(self._worker())
+                       for _ in range(self.workers)]
+
+    async def _stop_workers(self, app: web.Application):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+def check_webhook_config():
+    if not WEBHOOK_URL:
+        raise ValueError("Для BOT_MODE=webhook нужен WEBHOOK_URL — "
+                         "публичный адрес, на который Telegram шлёт "
+                         "обновления")
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot):
+    check_webhook_config()
+    # Те же startup/shutdown-хуки и данные, что и в dp.start_polling
+    workflow_data = {"dispatcher": dp, "bots": [bot], **dp.workflow_data}
+    await dp.emit_startup(bot=bot, **workflow_data)
+    server = WebhookServer(dp, bot, secret=WEBHOOK_SECRET,
+                           queue_size=WEBHOOK_QUEUE_SIZE,
+                           workers=WEBHOOK_WORKERS)
+    runner = web.AppRunner(server.create_app(WEBHOOK_PATH))
+    try:
+        await runner.setup()
+        await web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT).start()
+
+        await bot.set_webhook(
+            url=WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=dp.resolve_used_update_types(),
+        )
+        await asyncio.Event().wait()
+    finally:
+        try:
+            await runner.cleanup()
+            await dp.emit_shutdown(bot=bot, **workflow_data)
+        finally:
+            # Хранилище закрывает и хук dispatcher'а, но если упал
+            # какой-то хук до него, закрываем сами — повторно это безопасно
+            await dp.storage.close()
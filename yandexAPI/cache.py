@@ -0,0 +1,62 @@
+from collections import OrderedDict
+
+from config import OBJECT_CACHE_BYTES
+
+
+class ObjectCache:
+    """LRU-кэш содержимого объектов S3 с ограничением по памяти.
+
+    Запись хранится вместе с ETag объекта и отдаётся только при совпадении
+    ETag, поэтому устаревшее содержимое никогда не попадёт к пользователю.
+    Когда суммарный размер превышает max_bytes, вытесняются давно не
+    использованные записи.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._items: OrderedDict[str, tuple[str, bytes]] = OrderedDict()
+
+    def get(self, key: str, etag: str) -> bytes | None:
+        item = self._items.get(key)
+        if item is None or item[0] != etag:
+            self.misses += 1
+            return None
+        self._items.move_to_end(key)
+        self.hits += 1
+        return item[1]
+
+    def put(self, key: str, etag: str, data: bytes):
+        if len(data) > self.max_bytes:
+            return
+        self._pop(key)
+        self._items[key] = (etag, data)
+        self.size += len(data)
+        while self.size > self.max_bytes:
+            oldest = next(iter(self._items))
+            self._pop(oldest)
+            self.evictions += 1
+
+    def invalidate_prefix(self, prefix: str):
+        for key in [k for k in self._items if k.startswith(prefix)]:
+            self._pop(key)
+
+    def _pop(self, key: str):
+        item = self._items.pop(key, None)
+        if item is not None:
+            self.size -= len(item[1])
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "items": len(self._items),
+            "bytes": self.size,
+        }
+
+
+OBJECT_CACHE = ObjectCache(OBJECT_CACHE_BYTES)
@@ -1,17 +1,88 @@
+import asyncio
+from functools import partial
 from pathlib import Path
-import boto3
+import aiofiles
 from aiogram import Bot
 from io import BytesIO
 
-from config import SECRET_KEY, ACCESS_KEY, ENDPOINT_URL, \
-    BUCKET_NAME
+from config import S3_PART_SIZE, S3_FANOUT
+from yandexAPI.cache import OBJECT_CACHE
+from yandexAPI.storage import STORAGE, MultipartWriter
+from utils.metrics import step
 
-CLIENT = boto3.client(
-    's3',
-    endpoint_url=ENDPOINT_URL,
-    aws_access_key_id=ACCESS_KEY,
-    aws_secret_access_key=SECRET_KEY
-)
+# Метаданные объекта с file_unique_id файла в Telegram: по нему повторно
+# отправленный файл узнаётся без скачивания
+METADATA_UNIQUE_ID = "tg-file-unique-id"
+
+
+async def stream_telegram_file(bot: Bot, file_path: str,
+                               chunk_size: int = 65536):
+    """Отдаёт содержимое файла из Telegram кусками по chunk_size байт."""
+    api = bot.session.api
+    if api.is_local:
+        async with aiofiles.open(api.wrap_local_file.to_local(file_path),
+                                 "rb") as f:
+            while chunk := await f.read(chunk_size):
+                yield chunk
+        return
+
+    url = api.file_url(bot.token, file_path)
+    async for chunk in bot.session.stream_content(
+            url=url, chunk_size=chunk_size, raise_for_status=True):
+        yield chunk
+
+
+async def stage_file(file: dict, bot: Bot, key: str) -> MultipartWriter:
+    """Перекачивает файл из Telegram в незавершённую multipart-загрузку."""
+    unique_id = file.get("file_unique_id")
+    writer = MultipartWriter(
+        STORAGE, key, get_content_type(key), part_size=S3_PART_SIZE,
+        metadata={METADATA_UNIQUE_ID: unique_id} if unique_id else None)
+    try:
+        tg_file = await bot.get_file(file["file_id"])
+        await writer.start()
+        async for chunk in stream_telegram_file(bot, tg_file.file_path):
+            await writer.write(chunk)
+        await writer.finish()
+    except Exception:
+        await writer.abort()
+        raise
+    return writer
+
+
+async def stage_or_skip(file: dict, bot: Bot, key: str,
+                        listing: asyncio.Task) -> MultipartWriter | None:
+    """Как stage_file, но возвращает None, если под ключом уже лежит тот же
+    файл.
+
+    Сначала сверяется file_unique_id из метаданных объекта — тогда файл
+    даже не скачивается из Telegram. Если он не совпал (например, тот же
+    PDF отправлен заново из другого чата), скачанное содержимое
+    сравнивается с ETag объекта и одинаковая загрузка отменяется.
+    """
+    try:
+        # shield: отмена одной загрузки не должна отменять общий листинг
+        contents = await asyncio.shield(listing)
+    except Exception:
+        # Ошибку листинга сообщит upload_all_or_none
+        contents = []
+    etag = next((obj["ETag"] for obj in contents if obj["Key"] == key), None)
+
+    unique_id = file.get("file_unique_id")
+    if etag is not None and unique_id:
+        try:
+            metadata = await STORAGE.get_metadata(key)
+        except Exception as e:
+            print(f"Не удалось получить метаданные {key}: {e}")
+            metadata = {}
+        if metadata.get(METADATA_UNIQUE_ID) == unique_id:
+            return None
+
+    writer = await stage_file(file, bot, key)
+    if etag is not None and writer.matches(etag):
+        await writer.abort()
+        return None
+    return writer
 
 
 async def upload_all_or_none(files: list[dict], bot: Bot) -> bool:
@@ -19,63 +90,81 @@ async def upload_all_or_none(files: list[dict], bot: Bot) -> bool:
         return False
 
     prefix = files[0]["mask_for_save"]
-    loaded_files = []
 
-    # 1. Скачиваем все файлы из Telegram
-    for file in files:
-        try:
-            tg_file = await bot.get_file(file["file_id"])
-            file_data = await bot.download_file(tg_file.file_path)
-            buffer = BytesIO(file_data.read())
-
-            loaded_files.append({
-                "path": prefix + file["original_file_name"],
-                "buffer": buffer
-            })
-        except Exception as e:
-            print(f"Ошибка скачивания {file['original_file_name']}: {e}")
-            return False
+    # 1. Параллельно стримим все файлы из Telegram в S3 и забираем список
+    # старых файлов. Загрузки не завершаем, пока не скачаны все файлы,
+    # поэтому в бакете пока ничего не меняется. Файлы, которые уже лежат
+    # под своим ключом, не перекачиваются
+    listing = asyncio.create_task(STORAGE.list_objects(prefix))
+    with step("stage_files"):
+        results = await gather_bounded(
+            [partial(stage_or_skip, file, bot,
+                     prefix + file["original_file_name"], listing)
+             for file in files],
+            limit=S3_FANOUT,
+        )
+    staged: list[MultipartWriter] = [
+        r for r in results if isinstance(r, MultipartWriter)]
+    unchanged = [prefix + file["original_file_name"]
+                 for file, result in zip(files, results) if result is None]
+
+    failed = False
+    for file, result in zip(files, results):
+        if isinstance(result, BaseException):
+            print(f"Ошибка скачивания {file['original_file_name']}: {result}")
+            failed = True
+    if failed:
+        listing.cancel()
+        await asyncio.gather(listing, return_exceptions=True)
+        await abort_all(staged)
+        return False
+
+    # МНОГО ВАЖНО: какие ключи должны остаться после загрузки, включая
+    # неизменённые
+    new_keys = {prefix + file["original_file_name"] for file in files}
 
     # 2. Получаем старые файлы по префиксу
     try:
-        response = CLIENT.list_objects_v2(Bucket=BUCKET_NAME, Prefix=prefix)
-        new_keys = {item["path"] for item in loaded_files}
-
+        contents = await listing
         old_keys = [
             obj["Key"]
-            for obj in response.get("Contents", [])
+            for obj in contents
             if obj["Key"] not in new_keys
         ]
     except Exception as e:
         print(f"Ошибка при получении списка старых файлов: {e}")
+        await abort_all(staged)
         return False
 
-    # МНОГО ВАЖНО: какие ключи должны остаться после загрузки
-    new_keys = {item["path"] for item in loaded_files}
+    if unchanged:
+        print(f"Без изменений: {unchanged}")
+    if not staged and not old_keys:
+        return True
 
-    # 3. Загружаем новые файлы
-    try:
-        for item in loaded_files:
-            content_type = get_content_type(item["path"])
-            print(content_type, item["path"])
-            CLIENT.put_object(
-                Bucket=BUCKET_NAME,
-                Key=item["path"],
-                Body=item["buffer"],
-                ContentType=content_type,
-            )
-            print(f"Загружен: {item['path']}")
-    except Exception as e:
-        print(f"Ошибка загрузки: {e}")
+    # 3. Завершаем загрузки — только теперь новые файлы появляются в бакете
+    with step("complete_uploads"):
+        results = await gather_bounded(
+            [writer.complete for writer in staged], limit=S3_FANOUT)
+    if staged:
+        OBJECT_CACHE.invalidate_prefix(prefix)
+    completed = [writer.key for writer, result in zip(staged, results)
+                 if not isinstance(result, BaseException)]
+    errors = [result for result in results if isinstance(result, BaseException)]
+    if errors:
+        print(f"Ошибка загрузки: {errors[0]}")
+        await abort_all([writer for writer, result in zip(staged, results)
+                         if isinstance(result, BaseException)])
+        await delete_quietly(completed)
         return False
+    if completed:
+        print(f"Загружены: {completed}")
 
     # 4. Удаляем только те старые файлы, которых НЕТ среди новых
     keys_to_delete = [k for k in old_keys if k not in new_keys]
 
     if keys_to_delete:
         try:
-            delete_payload = {"Objects": [{"Key": k} for k in keys_to_delete]}
-            CLIENT.delete_objects(Bucket=BUCKET_NAME, Delete=delete_payload)
+            await STORAGE.delete_objects(keys_to_delete)
             print(f"Удалены старые файлы: {keys_to_delete}")
         except Exception as e:
             print(f"Ошибка при удалении старых файлов: {e}")
@@ -84,27 +173,88 @@ async def upload_all_or_none(files: list[dict], bot: Bot) -> bool:
     return True
 
 
+async def gather_bounded(funcs: list, limit: int) -> list:
+    """Запускает корутины параллельно, но не больше limit одновременно.
 
-async def get_files_by_mask(prefix: str) -> list[dict] | None:
-    result = []
+    Результаты возвращаются в исходном порядке, исключения — вместо
+    результатов, как в asyncio.gather(return_exceptions=True).
+    """
+    semaphore = asyncio.Semaphore(limit)
+
+    async def run(func):
+        async with semaphore:
+            return await func()
+
+    return await asyncio.gather(*(run(func) for func in funcs),
+                                return_exceptions=True)
+
+
+async def abort_all(writers: list[MultipartWriter]):
+    await asyncio.gather(*(writer.abort() for writer in writers))
+
+
+async def delete_quietly(keys: list[str]):
+    if not keys:
+        return
     try:
-        response = CLIENT.list_objects_v2(Bucket=BUCKET_NAME, Prefix=prefix)
-        contents = response.get("Contents", [])
+        await STORAGE.delete_objects(keys)
+    except Exception as e:
+        print(f"Не удалось откатить загруженные файлы {keys}: {e}")
 
-        for obj in contents:
-            key = obj["Key"]
-            file_data = CLIENT.get_object(Bucket=BUCKET_NAME, Key=key)[
-                "Body"].read()
 
-            result.append({
-                "filename": key.split("/")[-1],
-                "buffer": BytesIO(file_data)
-            })
+async def get_files_by_mask(prefix: str) -> list[dict] | None:
+    files = await list_files_by_mask(prefix)
+    if files is None:
+        return None
+    return await fetch_files(files)
 
+
+async def list_files_by_mask(prefix: str) -> list[dict] | None:
+    """Список файлов по префиксу без скачивания содержимого."""
+    try:
+        contents = await STORAGE.list_objects(prefix)
     except Exception as e:
         print(f"Ошибка при получении файлов по маске '{prefix}': {e}")
         return None
-    return result
+    return [
+        {
+            "key": obj["Key"],
+            "filename": obj["Key"].split("/")[-1],
+            "etag": obj["ETag"],
+        }
+        for obj in contents
+    ]
+
+
+async def fetch_files(files: list[dict]) -> list[dict] | None:
+    """Докачивает содержимое файлов из list_files_by_mask в поле buffer."""
+    bodies = await gather_bounded(
+        [partial(read_object, file["key"], file.get("etag"))
+         for file in files],
+        limit=S3_FANOUT,
+    )
+    for file, body in zip(files, bodies):
+        if isinstance(body, BaseException):
+            print(f"Ошибка при получении файла '{file['key']}': {body}")
+            return None
+    return [
+        {**file, "buffer": BytesIO(body)}
+        for file, body in zip(files, bodies)
+    ]
+
+
+async def read_object(key: str, etag: str | None = None) -> bytes:
+    """Читает объект через OBJECT_CACHE.
+
+    Если ETag не известен из листинга, сверяем его дешёвым HEAD-запросом.
+    """
+    if etag is None:
+        etag = await STORAGE.head_object(key)
+    data = OBJECT_CACHE.get(key, etag)
+    if data is None:
+        data, etag = await STORAGE.get_object(key)
+        OBJECT_CACHE.put(key, etag, data)
+    return data
 
 
 def get_content_type(filename: str) -> str:
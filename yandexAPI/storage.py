@@ -0,0 +1,227 @@
+import asyncio
+import hashlib
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import boto3
+from botocore.config import Config
+
+from config import SECRET_KEY, ACCESS_KEY, ENDPOINT_URL, BUCKET_NAME, \
+    S3_MAX_CONNECTIONS, S3_MAX_IN_FLIGHT
+from utils.metrics import S3_LATENCY, S3_ERRORS, S3_BYTES
+from utils.tracing import span
+
+# S3 не принимает части multipart-загрузки меньше 5 МБ (кроме последней)
+MIN_PART_SIZE = 5 * 1024 * 1024
+
+
+class S3Storage:
+    """Асинхронная обёртка над boto3-клиентом.
+
+    Синхронные вызовы boto3 выполняются в отдельном пуле потоков, поэтому
+    event loop бота не блокируется. Клиент потокобезопасен и держит пул
+    HTTP-соединений размера max_connections, а семафор ограничивает число
+    одновременных запросов к хранилищу.
+    """
+
+    def __init__(self, bucket: str, endpoint_url: str | None,
+                 access_key: str | None, secret_key: str | None,
+                 max_connections: int = 20, max_in_flight: int = 16):
+        self.bucket = bucket
+        self.client = boto3.client(
+            's3',
+            endpoint_url=endpoint_url,
+            aws_access_key_id=access_key,
+            aws_secret_access_key=secret_key,
+            config=Config(max_pool_connections=max_connections),
+        )
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_in_flight, thread_name_prefix="s3")
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+
+    async def _call(self, method: str, **kwargs):
+        func = partial(getattr(self.client, method), Bucket=self.bucket,
+                       **kwargs)
+        return await self._run(method, func)
+
+    async def _run(self, operation: str, func):
+        # Время считаем без ожидания семафора: это время самого запроса
+        async with self._semaphore:
+            loop = asyncio.get_running_loop()
+            started = time.perf_counter()
+            try:
+                with span(f"s3 {operation}"):
+                    return await loop.run_in_executor(self._executor, func)
+            except Exception:
+                S3_ERRORS.labels(operation).inc()
+                raise
+            finally:
+                S3_LATENCY.labels(operation).observe(
+                    time.perf_counter() - started)
+
+    async def put_object(self, key: str, body: bytes,
+                         content_type: str) -> dict:
+        S3_BYTES.labels("out").inc(len(body))
+        return await self._call("put_object", Key=key, Body=body,
+                                ContentType=content_type)
+
+    async def get_object(self, key: str) -> tuple[bytes, str]:
+        """Возвращает содержимое объекта и его ETag."""
+        def read():
+            response = self.client.get_object(Bucket=self.bucket, Key=key)
+            return response["Body"].read(), response["ETag"]
+
+        # Тело читаем в том же потоке, что и запрос: иначе чтение стрима
+        # снова заблокирует event loop
+        body, etag = await self._run("get_object", read)
+        S3_BYTES.labels("in").inc(len(body))
+        return body, etag
+
+    async def head_object(self, key: str) -> str:
+        response = await self._call("head_object", Key=key)
+        return response["ETag"]
+
+    async def get_metadata(self, key: str) -> dict[str, str]:
+        """Пользовательские метаданные объекта (x-amz-meta-*)."""
+        response = await self._call("head_object", Key=key)
+        return response.get("Metadata", {})
+
+    async def list_objects(self, prefix: str) -> list[dict]:
+        # list_objects_v2 отдаёт не больше 1000 ключей за раз
+        contents = []
+        kwargs = {"Prefix": prefix}
+        while True:
+            response = await self._call("list_objects_v2", **kwargs)
+            contents.extend(response.get("Contents", []))
+            if not response.get("IsTruncated"):
+                return contents
+            kwargs["ContinuationToken"] = response["NextContinuationToken"]
+
+    async def delete_objects(self, keys: list[str]):
+        # delete_objects принимает не больше 1000 ключей за запрос
+        for i in range(0, len(keys), 1000):
+            payload = {"Objects": [{"Key": k} for k in keys[i:i + 1000]]}
+            await self._call("delete_objects", Delete=payload)
+
+    async def create_multipart_upload(
+            self, key: str, content_type: str,
+            metadata: dict[str, str] | None = None) -> str:
+        response = await self._call("create_multipart_upload", Key=key,
+                                    ContentType=content_type,
+                                    Metadata=metadata or {})
+        return response["UploadId"]
+
+    async def upload_part(self, key: str, upload_id: str, part_number: int,
+                          body: bytes) -> str:
+        S3_BYTES.labels("out").inc(len(body))
+        response = await self._call("upload_part", Key=key,
+                                    UploadId=upload_id,
+                                    PartNumber=part_number, Body=body)
+        return response["ETag"]
+
+    async def complete_multipart_upload(self, key: str, upload_id: str,
+                                        parts: list[dict]) -> dict:
+        return await self._call("complete_multipart_upload", Key=key,
+                                UploadId=upload_id,
+                                MultipartUpload={"Parts": parts})
+
+    async def abort_multipart_upload(self, key: str, upload_id: str) -> dict:
+        return await self._call("abort_multipart_upload", Key=key,
+                                UploadId=upload_id)
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        self.client.close()
+
+
+class MultipartWriter:
+    """Потоковая запись объекта через multipart-загрузку.
+
+    Данные копятся в буфере размером part_size и уходят в S3 частями,
+    поэтому память на одну загрузку не зависит от размера файла. Объект
+    появляется в бакете только после complete(), до этого загрузку можно
+    отменить через abort() без следов в бакете.
+
+    По ходу записи считаются MD5 всего файла и каждой части, поэтому ещё
+    до complete() можно сравнить содержимое с ETag уже лежащего объекта.
+    """
+
+    def __init__(self, storage: S3Storage, key: str, content_type: str,
+                 part_size: int = MIN_PART_SIZE,
+                 metadata: dict[str, str] | None = None):
+        self.storage = storage
+        self.key = key
+        self.content_type = content_type
+        self.part_size = max(part_size, MIN_PART_SIZE)
+        self.metadata = metadata
+        self.upload_id: str | None = None
+        self._parts: list[dict] = []
+        self._buffer = bytearray()
+        self._md5 = hashlib.md5(usedforsecurity=False)
+        self._part_md5s: list[bytes] = []
+
+    async def start(self):
+        self.upload_id = await self.storage.create_multipart_upload(
+            self.key, self.content_type, self.metadata)
+
+    async def write(self, chunk: bytes):
+        self._md5.update(chunk)
+        self._buffer += chunk
+        # Части режутся ровно по part_size, а не по границам кусков из
+        # Telegram: тогда ETag одного и того же файла всегда одинаковый
+        while len(self._buffer) >= self.part_size:
+            await self._flush(self.part_size)
+
+    async def _flush(self, size: int | None = None):
+        body = bytes(self._buffer[:size])
+        del self._buffer[:len(body)]
+        self._part_md5s.append(
+            hashlib.md5(body, usedforsecurity=False).digest())
+        part_number = len(self._parts) + 1
+        etag = await self.storage.upload_part(
+            self.key, self.upload_id, part_number, body)
+        self._parts.append({"PartNumber": part_number, "ETag": etag})
+
+    async def finish(self):
+        """Дозагружает остаток буфера. Объект ещё не виден в бакете."""
+        if self._buffer or not self._parts:
+            await self._flush()
+
+    def matches(self, etag: str) -> bool:
+        """Совпадает ли записанное содержимое с объектом с таким ETag.
+
+        ETag multipart-объекта — MD5 от склеенных MD5 частей с суффиксом
+        «-число частей», обычного — MD5 всего файла. Для multipart
+        сравнение верно, пока не менялся размер части S3_PART_SIZE.
+        """
+        etag = etag.strip('"')
+        if "-" not in etag:
+            return etag == self._md5.hexdigest()
+        combined = hashlib.md5(b"".join(self._part_md5s),
+                               usedforsecurity=False).hexdigest()
+        return etag == f"{combined}-{len(self._part_md5s)}"
+
+    async def complete(self):
+        await self.storage.complete_multipart_upload(
+            self.key, self.upload_id, self._parts)
+
+    async def abort(self):
+        self._buffer.clear()
+        if self.upload_id is None:
+            return
+        try:
+            await self.storage.abort_multipart_upload(self.key,
+                                                      self.upload_id)
+        except Exception as e:
+            print(f"Не удалось отменить загрузку {self.key}: {e}")
+
+
+STORAGE = S3Storage(
+    bucket=BUCKET_NAME,
+    endpoint_url=ENDPOINT_URL,
+    access_key=ACCESS_KEY,
+    secret_key=SECRET_KEY,
+    max_connections=S3_MAX_CONNECTIONS,
+    max_in_flight=S3_MAX_IN_FLIGHT,
+)